@@ -14,6 +14,7 @@ def migrate():
         old_config = json.load(f)
 
     tools = []
+    servers = {}
     
     # Iterate over old servers
     for server_name, server_config in old_config.get("mcpServers", {}).items():
@@ -28,21 +29,20 @@ def migrate():
             full_command.append(command)
         full_command.extend(args)
 
-        # We cannot know the tools without running the server.
-        # We will create a placeholder.
-        tools.append({
-            "name": f"{server_name}_proxy_tool",
-            "description": f"Imported from {server_name}. PLEASE UPDATE manually with specific tool names and input schemas.",
+        # We cannot know the tools without running the server, so expose
+        # all of them: the router learns names and schemas on first start.
+        servers[server_name] = {
             "command": full_command if full_command else ["echo", "check_command"],
-            "inputSchema": {}
-        })
+            "env": server_config.get("env", {}),
+        }
+        tools.append({"server": server_name, "prefix": ""})
 
-    new_manifest = {"tools": tools}
+    new_manifest = {"servers": servers, "tools": tools}
     
     with open(manifest_path, "w") as f:
         json.dump(new_manifest, f, indent=2)
     
-    print(f"Migration complete. Created {manifest_path}. Please review and update tool definitions.")
+    print(f"Migration complete. Created {manifest_path}. Tools are discovered when the router first lists them.")
 
 if __name__ == "__main__":
     migrate()
@@ -0,0 +1,103 @@
+import bisect
+import heapq
+import re
+from math import log
+from typing import Dict, List, Sequence, Tuple
+
+# A document is a list of (text, weight) fields; weight scales term frequency
+Document = Sequence[Tuple[str, float]]
+
+_SPLIT = re.compile(r"[\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split on anything but letters and digits.
+
+    Unlike the UI/UX search this keeps two-letter tokens, since tool names
+    are full of them ("gh", "db", "ai").
+    """
+    return [w for w in _SPLIT.split(str(text).lower()) if len(w) > 1]
+
+
+class BM25Index:
+    """BM25 ranking over an inverted index, built once and queried many times.
+
+    Adapted from the BM25 class in .shared/ui-ux-pro-max/scripts/core.py,
+    which scores every document per query. Here each posting stores its
+    precomputed BM25 contribution, so a query only touches the documents
+    that contain one of its terms and just sums floats. Query terms of three
+    or more characters also match longer index terms they are a prefix of
+    ("data" -> "database"), at `prefix_weight`.
+    """
+
+    MAX_EXPANSIONS = 50
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, prefix_weight: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.prefix_weight = prefix_weight
+        self.N = 0
+        # term -> [(doc index, score contribution)]
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.vocab: List[str] = []
+
+    def fit(self, documents: Sequence[Document]):
+        term_freqs: List[Dict[str, float]] = []
+        doc_lengths: List[float] = []
+        doc_freqs: Dict[str, int] = {}
+        for fields in documents:
+            tf: Dict[str, float] = {}
+            for text, weight in fields:
+                for word in tokenize(text):
+                    tf[word] = tf.get(word, 0.0) + weight
+            term_freqs.append(tf)
+            doc_lengths.append(sum(tf.values()))
+            for word in tf:
+                doc_freqs[word] = doc_freqs.get(word, 0) + 1
+
+        self.N = len(term_freqs)
+        if self.N == 0:
+            return
+        avgdl = (sum(doc_lengths) / self.N) or 1.0
+        idf = {w: log((self.N - n + 0.5) / (n + 0.5) + 1) for w, n in doc_freqs.items()}
+
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for idx, tf in enumerate(term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[idx] / avgdl)
+            for word, freq in tf.items():
+                impact = idf[word] * freq * (self.k1 + 1) / (freq + norm)
+                postings.setdefault(word, []).append((idx, impact))
+        self.postings = postings
+        self.vocab = sorted(postings)
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        terms = [(token, 1.0)] if token in self.postings else []
+        if len(token) < 3:
+            return terms
+        i = bisect.bisect_right(self.vocab, token)
+        end = min(len(self.vocab), i + self.MAX_EXPANSIONS)
+        while i < end and self.vocab[i].startswith(token):
+            terms.append((self.vocab[i], self.prefix_weight))
+            i += 1
+        return terms
+
+    def score(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document matching at least one query term."""
+        scores: Dict[int, float] = {}
+        for token in dict.fromkeys(tokenize(query)):
+            # A document counts once per query term, via its best-matching expansion
+            best: Dict[int, float] = {}
+            for term, weight in self._expand(token):
+                for idx, impact in self.postings[term]:
+                    s = impact * weight
+                    if s > best.get(idx, 0.0):
+                        best[idx] = s
+            for idx, s in best.items():
+                scores[idx] = scores.get(idx, 0.0) + s
+        return scores
+
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[int, List[Tuple[int, float]]]:
+        """Top `limit` (doc index, score) pairs after skipping `offset`, plus the match count."""
+        scores = self.score(query)
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return len(scores), top[offset:]
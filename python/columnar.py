@@ -0,0 +1,267 @@
+# /// script
+# dependencies = ["numpy"]
+# ///
+"""Columnar copies of closed usage log segments, and reports over them.
+
+    uv run python/columnar.py compact [--force]
+    uv run python/columnar.py report [--since T] [--until T] [--tool NAME] [--bucket SECONDS] [--json]
+
+`compact` turns every rotated segment (logs/usage-<first>-<last>.jsonl.gz)
+into a directory under logs/columnar/ holding one .npy array per column:
+timestamp (float64), tool (int32 codes into tools.json), duration
+(float32) and success (bool). `report` memory-maps those arrays and
+computes per-tool latency percentiles and error rates, a latency
+histogram and time-bucketed call/error rates with NumPy, without parsing
+any JSON. The active log is left alone until it is rotated.
+
+NumPy is only needed for these commands; the router does not use it.
+"""
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from usage_log import segment_paths, segment_range, open_segment
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LOG_FILE = os.path.join(REPO_ROOT, "logs", "usage.jsonl")
+COLUMNAR_DIR = os.path.join(REPO_ROOT, "logs", "columnar")
+
+COLUMNS = ("timestamp", "tool", "duration", "success")
+# Written last, so a directory without it is an interrupted compaction
+TOOLS_FILE = "tools.json"
+
+# Latency histogram: log-spaced bins from 1ms to 10 minutes
+HISTOGRAM_BINS = 24
+HISTOGRAM_RANGE = (1e-3, 600.0)
+
+# Percentiles reported per tool
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _segment_name(path: str) -> str:
+    name = os.path.basename(path)
+    return name[:-len(".jsonl.gz")] if name.endswith(".jsonl.gz") else name[:-len(".jsonl")]
+
+
+def compact_segment(path: str, out_dir: str) -> int:
+    """Write the columns of one segment into `out_dir`; returns its row count."""
+    timestamps: List[float] = []
+    durations: List[float] = []
+    successes: List[bool] = []
+    codes: List[int] = []
+    tool_codes: Dict[str, int] = {}
+    with open_segment(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                ts = float(entry["timestamp"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            tool = entry.get("tool") or ""
+            code = tool_codes.get(tool)
+            if code is None:
+                code = tool_codes[tool] = len(tool_codes)
+            timestamps.append(ts)
+            codes.append(code)
+            durations.append(float(entry.get("duration") or 0.0))
+            successes.append(bool(entry.get("success")))
+
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "timestamp.npy"), np.array(timestamps, dtype=np.float64))
+    np.save(os.path.join(tmp_dir, "tool.npy"), np.array(codes, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "duration.npy"), np.array(durations, dtype=np.float32))
+    np.save(os.path.join(tmp_dir, "success.npy"), np.array(successes, dtype=np.bool_))
+    with open(os.path.join(tmp_dir, TOOLS_FILE), "w", encoding="utf-8") as f:
+        json.dump(sorted(tool_codes, key=tool_codes.get), f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return len(timestamps)
+
+
+def compact(log_path: str = LOG_FILE, out_root: str = COLUMNAR_DIR, force: bool = False) -> int:
+    """Compact every closed segment not compacted yet. Returns the number done."""
+    done = 0
+    os.makedirs(out_root, exist_ok=True)
+    for path in segment_paths(log_path):
+        out_dir = os.path.join(out_root, _segment_name(path))
+        if not force and os.path.exists(os.path.join(out_dir, TOOLS_FILE)):
+            continue
+        rows = compact_segment(path, out_dir)
+        print(f"{os.path.basename(path)}: {rows} rows")
+        done += 1
+    return done
+
+
+def load(out_root: str = COLUMNAR_DIR, since: float = 0.0, until: Optional[float] = None):
+    """All compacted rows overlapping [since, until] as
+    (timestamp, tool codes, duration, success, tool names).
+
+    Each segment's codes are mapped into one shared dictionary.
+    """
+    names: Dict[str, int] = {}
+    parts: Dict[str, list] = {column: [] for column in COLUMNS}
+    for entry in sorted(os.listdir(out_root)) if os.path.isdir(out_root) else []:
+        seg_dir = os.path.join(out_root, entry)
+        span = segment_range(entry + ".jsonl")
+        if span is None or not os.path.exists(os.path.join(seg_dir, TOOLS_FILE)):
+            continue
+        if span[1] + 1 < since or (until is not None and span[0] > until):
+            continue
+        with open(os.path.join(seg_dir, TOOLS_FILE), "r", encoding="utf-8") as f:
+            seg_tools = json.load(f)
+        remap = np.array([names.setdefault(t, len(names)) for t in seg_tools], dtype=np.int32)
+        columns = {c: np.load(os.path.join(seg_dir, c + ".npy"), mmap_mode="r") for c in COLUMNS}
+        if len(remap):
+            columns["tool"] = remap[columns["tool"]]
+        for c in COLUMNS:
+            parts[c].append(columns[c])
+
+    if not parts["timestamp"]:
+        empty = {"timestamp": np.float64, "tool": np.int32, "duration": np.float32, "success": np.bool_}
+        return tuple(np.empty(0, dtype=empty[c]) for c in COLUMNS) + ([],)
+    ts, tool, duration, success = (np.concatenate(parts[c]) for c in COLUMNS)
+    mask = ts >= since
+    if until is not None:
+        mask &= ts <= until
+    return ts[mask], tool[mask], duration[mask], success[mask], sorted(names, key=names.get)
+
+
+def tool_summary(tool, duration, success, names: List[str]) -> Dict[str, Dict]:
+    """Per tool: calls, errors, error rate and latency percentiles."""
+    quantiles = np.array(QUANTILES)
+    # Group rows by tool (a stable integer sort), then select each group's
+    # percentiles with a linear-time partition instead of sorting it
+    order = np.argsort(tool, kind="stable")
+    tool_sorted = tool[order]
+    duration_grouped = duration[order].astype(np.float64)
+    errors = np.bincount(tool, weights=~success, minlength=len(names))
+    starts = np.searchsorted(tool_sorted, np.arange(len(names)), side="left")
+    ends = np.searchsorted(tool_sorted, np.arange(len(names)), side="right")
+    summary = {}
+    for code, name in enumerate(names):
+        start, end = starts[code], ends[code]
+        count = end - start
+        if not count:
+            continue
+        ranks = np.minimum(count - 1, np.ceil(quantiles * count).astype(np.int64) - 1)
+        block = np.partition(duration_grouped[start:end], np.append(ranks, count - 1))
+        p50, p90, p99 = block[ranks]
+        summary[name] = {
+            "calls": int(count),
+            "errors": int(errors[code]),
+            "error_rate": round(float(errors[code]) / float(count), 4),
+            "mean": float(block.mean()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p99": float(p99),
+            "max": float(block[count - 1]),
+        }
+    return summary
+
+
+def latency_histogram(duration) -> List[Dict]:
+    edges = np.geomspace(HISTOGRAM_RANGE[0], HISTOGRAM_RANGE[1], HISTOGRAM_BINS + 1)
+    clipped = np.clip(duration, edges[0], edges[-1])
+    counts, _ = np.histogram(clipped, bins=edges)
+    return [{"le": float(edge), "count": int(n)} for edge, n in zip(edges[1:], counts)]
+
+
+def bucketed_rates(ts, success, bucket: float) -> List[Dict]:
+    """Calls and errors per `bucket` seconds, for buckets with any calls."""
+    if not len(ts):
+        return []
+    slots = ts // bucket
+    index = (slots - slots.min()).astype(np.int64)
+    calls = np.bincount(index)
+    errors = np.bincount(index, weights=~success).astype(np.int64)
+    origin = slots.min() * bucket
+    used = np.nonzero(calls)[0]
+    return [
+        {
+            "start": datetime.fromtimestamp(origin + i * bucket, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "calls": int(calls[i]),
+            "errors": int(errors[i]),
+            "per_second": round(float(calls[i]) / bucket, 4),
+        }
+        for i in used
+    ]
+
+
+def report(out_root: str = COLUMNAR_DIR, since: float = 0.0, until: Optional[float] = None,
+           tool: Optional[str] = None, bucket: float = 3600.0) -> Dict:
+    ts, codes, duration, success, names = load(out_root, since, until)
+    if tool is not None:
+        mask = codes == (names.index(tool) if tool in names else -1)
+        ts, codes, duration, success = ts[mask], codes[mask], duration[mask], success[mask]
+    return {
+        "rows": int(len(ts)),
+        "tools": tool_summary(codes, duration, success, names),
+        "latency_histogram": latency_histogram(duration),
+        "rates": bucketed_rates(ts, success, bucket),
+    }
+
+
+def _parse_time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def _print_report(result: Dict):
+    print(f"{result['rows']} calls")
+    print(f"{'tool':32} {'calls':>8} {'err%':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, s in sorted(result["tools"].items(), key=lambda item: -item[1]["calls"]):
+        print(
+            f"{name[:32]:32} {s['calls']:>8} {s['error_rate'] * 100:>6.1f} {s['p50'] * 1000:>9.1f} "
+            f"{s['p90'] * 1000:>9.1f} {s['p99'] * 1000:>9.1f} {s['max'] * 1000:>9.1f}"
+        )
+    print()
+    print(f"{'bucket start':22} {'calls':>8} {'errors':>8} {'per s':>8}")
+    for r in result["rates"]:
+        print(f"{r['start']:22} {r['calls']:>8} {r['errors']:>8} {r['per_second']:>8.3f}")
+
+
+def main(argv: List[str]) -> int:
+    if np is None:
+        sys.stderr.write("columnar.py needs numpy: run it with `uv run python/columnar.py ...` or `pip install numpy`\n")
+        return 1
+    if argv[:1] == ["compact"]:
+        compact(force="--force" in argv)
+        return 0
+    if argv[:1] == ["report"]:
+        options = {}
+        args = argv[1:]
+        for i, arg in enumerate(args):
+            if arg in ("--since", "--until", "--tool", "--bucket") and i + 1 < len(args):
+                options[arg[2:]] = args[i + 1]
+        result = report(
+            since=_parse_time(options["since"]) if "since" in options else 0.0,
+            until=_parse_time(options["until"]) if "until" in options else None,
+            tool=options.get("tool"),
+            bucket=float(options.get("bucket", 3600)),
+        )
+        if "--json" in args:
+            print(json.dumps(result, indent=2))
+        else:
+            _print_report(result)
+        return 0
+    sys.stderr.write(__doc__.split("\n\n")[1] + "\n")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,6 +3,8 @@ import re
 import urllib.request
 import os
 
+from registry import compile_registry
+
 COMMUNITY_PATH = os.path.join(os.path.dirname(__file__), "community_servers.json")
 
 def fetch_content(url):
@@ -106,11 +108,22 @@ def main():
     output = {"tools": final_tools}
     
     try:
-        with open(COMMUNITY_PATH, "w", encoding="utf-8") as f:
+        # Write then rename, so a running router never reads a half-written file
+        tmp_path = COMMUNITY_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(output, f, indent=2)
+        os.replace(tmp_path, COMMUNITY_PATH)
         print(f"Saved {len(final_tools)} tools to {COMMUNITY_PATH}")
     except Exception as e:
         print(f"Error saving registry: {e}")
+        return
+
+    try:
+        # Compiled copy the router memory-maps instead of parsing the JSON
+        print(f"Compiled registry to {compile_registry(COMMUNITY_PATH)}")
+    except Exception as e:
+        # The JSON is saved; the router compiles it itself on its next load
+        print(f"Error compiling registry (the saved JSON is still used): {e}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,57 @@
+import os
+import sys
+from typing import Callable, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class FileCache(Generic[T]):
+    """Value derived from a file, rebuilt only when the file changes.
+
+    Each get() costs one stat(); the file is re-read and `build` re-run only
+    when its mtime or size differs from the last load. `build` receives the
+    path, or None when the file does not exist. If a rebuild fails, the
+    previous value is kept until the file changes again. `on_replace` is
+    called with each value once a rebuild has superseded it, e.g. to release
+    a file mapping it holds.
+    """
+
+    def __init__(self, path: str, build: Callable[[Optional[str]], T], label: str = "file",
+                 on_replace: Optional[Callable[[T], None]] = None):
+        self.path = path
+        self.label = label
+        self._build = build
+        self._on_replace = on_replace
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._value: Optional[T] = None
+        self._loaded = False
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> T:
+        stamp = self._stat()
+        if self._loaded and stamp == self._stamp:
+            return self._value
+        try:
+            value = self._build(self.path if stamp is not None else None)
+        except Exception as e:
+            sys.stderr.write(f"Error loading {self.label}: {e}\n")
+            value = self._value if self._loaded else self._build(None)
+        old, self._value = self._value, value
+        self._stamp = stamp
+        self._loaded = True
+        if self._on_replace is not None and old is not None and old is not value:
+            try:
+                self._on_replace(old)
+            except Exception as e:
+                sys.stderr.write(f"Error releasing previous {self.label}: {e}\n")
+        return value
+
+    def invalidate(self):
+        """Force a rebuild on the next get(), e.g. after writing the file ourselves."""
+        self._loaded = False
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from mcp.client.stdio import StdioServerParameters
+
+import tool_envs
+
+# $VAR or ${VAR} in a command part
+_VAR_REF = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+
+
+def get_command_hash(command: List[str], env: Dict[str, str]) -> str:
+    # Include env in hash to ensure config changes trigger new servers
+    data = json.dumps({"cmd": command, "env": env}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class LaunchPlan:
+    """How to start one manifest server, resolved once.
+
+    `key` identifies the server in the pool: a hash of the resolved argv and
+    the env the manifest adds, so unrelated changes to the router's own
+    environment do not fork a second server. The plan stays valid while
+    the environment variables it was resolved against (PATH and any the
+    command references) are unchanged.
+    """
+
+    key: str
+    argv: Tuple[str, ...]
+    # Variables set on top of the router's environment
+    env_delta: Tuple[Tuple[str, str], ...]
+    # (variable, value at compile time) the resolution depended on
+    depends: Tuple[Tuple[str, Optional[str]], ...]
+    params: StdioServerParameters
+
+    def is_current(self) -> bool:
+        return all(os.environ.get(name) == value for name, value in self.depends)
+
+
+def compile_plan(tool_def: Dict, repo_root: str) -> LaunchPlan:
+    """Resolve a manifest entry's command, env and pool key into a LaunchPlan.
+
+    If a pinned environment was prebuilt for the command (see tool_envs), its
+    entry point is exec'd directly instead of going through `uv run`.
+    """
+    command = tool_envs.resolve_prebuilt(tool_def["command"]) or tool_def["command"]
+
+    referenced = {"PATH"}
+    # Resolve absolute paths and expand variables in command
+    final_cmd = []
+    for i, part in enumerate(command):
+        # Expand vars first (e.g. ${DB_PATH})
+        referenced.update(a or b for a, b in _VAR_REF.findall(part))
+        expanded_part = os.path.expandvars(part)
+
+        # Check for absolute paths relative to repo root
+        possible_path = os.path.join(repo_root, expanded_part)
+        if os.path.exists(possible_path):
+            final_cmd.append(possible_path)
+        elif i == 0 and not os.path.isabs(expanded_part):
+            # Logic for executable resolution (first arg)
+            final_cmd.append(shutil.which(expanded_part) or expanded_part)
+        else:
+            final_cmd.append(expanded_part)
+
+    # Env values may reference the router's environment too ("${GITHUB_TOKEN}")
+    env_delta = {}
+    for name, value in (tool_def.get("env") or {}).items():
+        value = str(value)
+        referenced.update(a or b for a, b in _VAR_REF.findall(value))
+        env_delta[name] = os.path.expandvars(value)
+    env_delta["PYTHONUNBUFFERED"] = "1"
+    env = os.environ.copy()
+    env.update(env_delta)
+
+    return LaunchPlan(
+        key=get_command_hash(final_cmd, env_delta),
+        argv=tuple(final_cmd),
+        env_delta=tuple(sorted(env_delta.items())),
+        depends=tuple(sorted((name, os.environ.get(name)) for name in referenced)),
+        params=StdioServerParameters(command=final_cmd[0], args=final_cmd[1:], env=env),
+    )
+
+
+class LaunchPlanner:
+    """Cache of LaunchPlans per manifest entry.
+
+    Entries are looked up by identity: a reloaded manifest brings new dicts
+    and so new plans. Call clear() when something plans depend on outside
+    the entry changes, such as a newly prebuilt environment.
+    """
+
+    def __init__(self, repo_root: str):
+        self.repo_root = repo_root
+        self._plans: Dict[int, Tuple[Dict, LaunchPlan]] = {}
+
+    def plan_for(self, tool_def: Dict) -> LaunchPlan:
+        cached = self._plans.get(id(tool_def))
+        if cached is not None and cached[0] is tool_def and cached[1].is_current():
+            return cached[1]
+        plan = compile_plan(tool_def, self.repo_root)
+        self._plans[id(tool_def)] = (tool_def, plan)
+        return plan
+
+    def clear(self):
+        self._plans.clear()
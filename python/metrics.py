@@ -0,0 +1,137 @@
+import math
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Phases of a routed call, in the order they happen
+PHASES = ("resolve", "queue_wait", "spawn", "initialize", "prepare", "call", "serialize")
+
+# Bucket bounds (seconds) latency histograms are exported with
+EXPORT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Histogram:
+    """Fixed log-scale latency histogram.
+
+    Buckets grow by ~10% from 100us up to ~10 minutes, so recording is one
+    log() and an index increment with no allocation, and quantiles are
+    accurate to within a bucket width.
+
+    Given `bounds`, samples are also counted exactly per bound (the first
+    bound >= the sample, or past the last one), for export with bucket
+    boundaries that do not fall on the log-scale ones.
+    """
+
+    MIN = 1e-4
+    GROWTH = 1.1
+    BUCKETS = 165
+
+    def __init__(self, bounds: Sequence[float] = ()):
+        self.counts: List[int] = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bounds = tuple(bounds)
+        self.bound_counts: List[int] = [0] * (len(self.bounds) + 1) if self.bounds else []
+
+    def record(self, seconds: float):
+        if seconds <= self.MIN:
+            idx = 0
+        else:
+            idx = min(self.BUCKETS - 1, int(math.log(seconds / self.MIN) / math.log(self.GROWTH)) + 1)
+        self.counts[idx] += 1
+        if self.bounds:
+            self.bound_counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "Histogram"):
+        """Add `other`'s samples to this histogram."""
+        for idx, n in enumerate(other.counts):
+            if n:
+                self.counts[idx] += n
+        if self.bounds and other.bounds == self.bounds:
+            for idx, n in enumerate(other.bound_counts):
+                self.bound_counts[idx] += n
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    @classmethod
+    def upper_bound(cls, idx: int) -> float:
+        return cls.MIN * cls.GROWTH ** idx
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.upper_bound(idx), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class PhaseStats:
+    """Per-tool, per-phase latency histograms for routed calls."""
+
+    def __init__(self):
+        self._hists: Dict[str, Dict[str, Histogram]] = {}
+
+    def record(self, tool: str, phase: str, seconds: float):
+        phases = self._hists.get(tool)
+        if phases is None:
+            phases = self._hists[tool] = {}
+        hist = phases.get(phase)
+        if hist is None:
+            hist = phases[phase] = Histogram(EXPORT_BUCKETS)
+        hist.record(seconds)
+
+    def record_all(self, tool: str, phases: Dict[str, float]):
+        for phase, seconds in phases.items():
+            self.record(tool, phase, seconds)
+
+    def items(self) -> Iterator[Tuple[str, str, Histogram]]:
+        """(tool, phase, histogram) for everything recorded so far."""
+        for tool, phases in list(self._hists.items()):
+            for phase, hist in list(phases.items()):
+                yield tool, phase, hist
+
+    def summary(self, tool: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        tools = [tool] if tool is not None else list(self._hists)
+        return {
+            t: {phase: h.summary() for phase, h in self._hists.get(t, {}).items()}
+            for t in tools
+        }
+
+
+class CallCounters:
+    """Calls and errors per tool since the router started.
+
+    Recording increments a two-item list in place, so the hot path
+    allocates only the first time a tool is seen.
+    """
+
+    def __init__(self):
+        self.tools: Dict[str, List[int]] = {}
+
+    def record(self, tool: str, success: bool):
+        counts = self.tools.get(tool)
+        if counts is None:
+            counts = self.tools[tool] = [0, 0]
+        counts[0] += 1
+        if not success:
+            counts[1] += 1
@@ -0,0 +1,135 @@
+import asyncio
+import math
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import EXPORT_BUCKETS, Histogram
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _number(value: float) -> str:
+    """A sample value without rounding: integers in full, floats via repr()."""
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+class Exposition:
+    """Builds a scrape in the Prometheus text format.
+
+    Samples may be added in any order; each metric family's are collected
+    under it and written out together, as the format requires, with
+    families in the order they were first seen.
+    """
+
+    def __init__(self):
+        # family name -> its HELP/TYPE lines followed by its samples
+        self._families: Dict[str, List[str]] = {}
+
+    def _family(self, name: str, kind: str, help_text: str) -> List[str]:
+        lines = self._families.get(name)
+        if lines is None:
+            lines = self._families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        return lines
+
+    def sample(self, name: str, kind: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        self._family(name, kind, help_text).append(f"{name}{_labels(labels or {})} {_number(value)}")
+
+    def histogram(self, name: str, help_text: str, hist: Histogram, labels: Optional[Dict[str, str]] = None):
+        """Export a metrics.Histogram created with EXPORT_BUCKETS as its bounds,
+        whose per-bound counts are exact."""
+        if hist.bounds != EXPORT_BUCKETS:
+            raise ValueError(f"{name}: histogram is not bucketed by EXPORT_BUCKETS")
+        lines = self._family(name, "histogram", help_text)
+        labels = labels or {}
+        cumulative = 0
+        for le, n in zip(EXPORT_BUCKETS, hist.bound_counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': f'{le:g}'})} {cumulative}")
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {hist.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(hist.total)}")
+        lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+    def text(self) -> str:
+        return "".join(line + "\n" for lines in self._families.values() for line in lines)
+
+
+class MetricsServer:
+    """Minimal HTTP endpoint serving `render()` at /metrics.
+
+    Listens on host:port, or on a Unix socket when `socket_path` is given.
+    Each scrape calls render() on the event loop; nothing is computed
+    between scrapes.
+    """
+
+    def __init__(self, render: Callable[[], str], host: str = "127.0.0.1", port: int = 0,
+                 socket_path: Optional[str] = None):
+        self.render = render
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if self.socket_path:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    @property
+    def address(self) -> str:
+        return f"unix:{self.socket_path}" if self.socket_path else f"http://{self.host}:{self.port}/metrics"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Skip headers
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            status, body = self._respond(request)
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("ascii") + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, request: bytes) -> Tuple[str, str]:
+        parts = request.decode("latin-1").split()
+        if len(parts) < 2 or parts[0] != "GET":
+            return "405 Method Not Allowed", "GET only\n"
+        if parts[1].split("?")[0] not in ("/metrics", "/"):
+            return "404 Not Found", "See /metrics\n"
+        try:
+            return "200 OK", self.render()
+        except Exception as e:
+            sys.stderr.write(f"Error rendering metrics: {e}\n")
+            return "500 Internal Server Error", f"{e}\n"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
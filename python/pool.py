@@ -0,0 +1,634 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import anyio
+from mcp.client.stdio import stdio_client, StdioServerParameters
+from mcp.client.session import ClientSession
+
+# Pool modes a manifest entry can ask for via its "pool" key
+MODE_DEFAULT = "default"      # evicted after idle_ttl seconds without calls
+MODE_KEEP_WARM = "keep_warm"  # never evicted for idleness or by LRU pressure
+MODE_EPHEMERAL = "ephemeral"  # torn down as soon as its last in-flight call finishes
+POOL_MODES = (MODE_DEFAULT, MODE_KEEP_WARM, MODE_EPHEMERAL)
+
+
+class QueueFullError(Exception):
+    """Raised when a downstream's request queue is full and a call is refused."""
+
+
+@dataclass(frozen=True)
+class PoolPolicy:
+    mode: str = MODE_DEFAULT
+    idle_ttl: float = 600.0
+    # None means unlimited; max_concurrency applies to each replica
+    max_concurrency: Optional[int] = None
+    max_queue: Optional[int] = None
+    # Number of processes run for the same command, scaled between these
+    min_replicas: int = 1
+    max_replicas: int = 1
+    # Idle timeout for replicas started above min_replicas
+    replica_idle_ttl: float = 30.0
+
+    @classmethod
+    def from_tool_def(cls, tool_def: Dict, default_idle_ttl: float) -> "PoolPolicy":
+        """Read the lifecycle settings of a manifest entry.
+
+        Accepts either `"pool": "keep_warm"` or
+        `"pool": {"mode": "ephemeral", "idle_ttl": 30}`; a top-level
+        `"idle_ttl"` is honoured as a shorthand for the default mode.
+        """
+        pool_cfg = tool_def.get("pool") or {}
+        if isinstance(pool_cfg, str):
+            pool_cfg = {"mode": pool_cfg}
+
+        mode = pool_cfg.get("mode", MODE_DEFAULT)
+        if mode not in POOL_MODES:
+            sys.stderr.write(f"Unknown pool mode '{mode}' for {tool_def.get('name')}, using '{MODE_DEFAULT}'\n")
+            mode = MODE_DEFAULT
+
+        idle_ttl = pool_cfg.get("idle_ttl", tool_def.get("idle_ttl", default_idle_ttl))
+        max_concurrency = tool_def.get("max_concurrency")
+        max_queue = tool_def.get("max_queue")
+
+        # "replicas": 3 keeps three processes; {"min": 1, "max": 4} scales with load
+        replicas = tool_def.get("replicas") or 1
+        if not isinstance(replicas, dict):
+            replicas = {"min": replicas, "max": replicas}
+        min_replicas = max(1, int(replicas.get("min", 1)))
+        max_replicas = max(min_replicas, int(replicas.get("max", min_replicas)))
+
+        return cls(
+            mode=mode,
+            idle_ttl=float(idle_ttl),
+            max_concurrency=int(max_concurrency) if max_concurrency else None,
+            max_queue=int(max_queue) if max_queue is not None else None,
+            min_replicas=min_replicas,
+            max_replicas=max_replicas,
+            replica_idle_ttl=float(replicas.get("idle_ttl", min(30.0, float(idle_ttl)))),
+        )
+
+
+class CallLimiter:
+    """FIFO admission control for the calls sent to one downstream.
+
+    At most `max_concurrency` calls run at once; up to `max_queue` more wait
+    in arrival order and anything beyond that is refused with QueueFullError
+    instead of piling more latency onto everything already waiting.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self._waiters: deque = deque()
+        # Metrics
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    def configure(self, max_concurrency: Optional[int], max_queue: Optional[int]):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._wake()
+
+    def _has_slot(self) -> bool:
+        return self.max_concurrency is None or self.running < self.max_concurrency
+
+    async def acquire(self, label: str = "downstream") -> float:
+        """Wait for a slot and return how long the caller was queued."""
+        if self._has_slot() and not self._waiters:
+            self.running += 1
+            self.admitted += 1
+            return 0.0
+
+        if self.max_queue is not None and len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(
+                f"'{label}' is overloaded: {self.running} calls running and "
+                f"{len(self._waiters)} queued (max_queue={self.max_queue}). Retry later."
+            )
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Woken and cancelled in the same tick: hand the slot on
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def release(self):
+        self.running -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._has_slot():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.running += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "avg_wait": self.total_wait / self.queued if self.queued else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+@dataclass
+class ActiveServer:
+    process: Any
+    session: ClientSession
+    command_hash: str
+    exit_stack: Any
+    policy: PoolPolicy = field(default_factory=PoolPolicy)
+    # Replica index; replica 0 is keyed by the bare command_hash in the pool
+    replica: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    in_flight: int = 0
+    # Set to ask the owner task to unwind exit_stack and terminate the process
+    stop: asyncio.Event = field(default_factory=asyncio.Event)
+    # Set by the transport watcher once the process exited or its stdout hit EOF
+    exited: asyncio.Event = field(default_factory=asyncio.Event)
+    task: Optional[asyncio.Task] = None
+    # Started on a guess that it will be called soon; cleared by the first call
+    speculative: bool = False
+    speculative_ttl: float = 0.0
+    # Seconds spent creating the process and completing session.initialize()
+    spawn_time: float = 0.0
+    init_time: float = 0.0
+
+    @property
+    def key(self) -> str:
+        return replica_key(self.command_hash, self.replica)
+
+    @property
+    def is_surplus(self) -> bool:
+        """Started above min_replicas to absorb load; reclaimed quickly once idle."""
+        return self.replica >= self.policy.min_replicas
+
+    @property
+    def is_pinned(self) -> bool:
+        return self.policy.mode == MODE_KEEP_WARM and not self.is_surplus
+
+    @property
+    def is_usable(self) -> bool:
+        return not (self.stop.is_set() or self.exited.is_set())
+
+    def is_idle_expired(self, now: float) -> bool:
+        if self.in_flight:
+            return False
+        if self.speculative:
+            return now - self.last_used >= self.speculative_ttl
+        if self.is_pinned:
+            return False
+        ttl = self.policy.replica_idle_ttl if self.is_surplus else self.policy.idle_ttl
+        return now - self.last_used >= ttl
+
+
+def replica_key(cmd_hash: str, replica: int) -> str:
+    return cmd_hash if replica == 0 else f"{cmd_hash}#{replica}"
+
+
+class DownstreamPool:
+    """Owns the downstream MCP servers spawned by the router.
+
+    Each downstream lives in its own owner task: the task enters the stdio
+    transport and ClientSession contexts on `exit_stack`, then parks until
+    `stop` is set and unwinds the stack itself. anyio cancel scopes must be
+    exited by the task that entered them, so teardown always happens there
+    rather than in whichever task decided to evict the server.
+    """
+
+    def __init__(self, max_servers: int = 8, default_idle_ttl: float = 600.0, reap_interval: float = 5.0):
+        self.max_servers = max_servers
+        self.default_idle_ttl = default_idle_ttl
+        self.reap_interval = reap_interval
+        # Map replica key -> ActiveServer, least recently used first
+        self.servers: "OrderedDict[str, ActiveServer]" = OrderedDict()
+        self._reaper: Optional[asyncio.Task] = None
+        # Owner tasks of evicted servers that are still shutting down
+        self._closing: set = set()
+        # Map replica key -> future of a spawn that is still initializing
+        self._spawning: Dict[str, asyncio.Future] = {}
+        # Map command_hash -> CallLimiter
+        self._limiters: Dict[str, CallLimiter] = {}
+        # Replica spawns started for load rather than on behalf of a caller
+        self._background: set = set()
+        # Speculative pre-starts: how many were made, used, and evicted unused
+        self.speculation = {"spawned": 0, "hits": 0, "misses": 0}
+        # Processes started (including respawns), failed to start, and stopped
+        self.lifecycle = {"spawned": 0, "spawn_failed": 0, "stopped": 0}
+
+    def policy_for(self, tool_def: Dict) -> PoolPolicy:
+        return PoolPolicy.from_tool_def(tool_def, self.default_idle_ttl)
+
+    async def call_tool(self, cmd_hash: str, params: StdioServerParameters, policy: PoolPolicy,
+                        name: str, arguments: dict, trace: Optional[Dict[str, Any]] = None,
+                        prepare: Optional[Callable[[ClientSession], Awaitable[Optional[str]]]] = None,
+                        meta: Optional[Dict[str, Any]] = None):
+        """Forward a tool call to the pooled server, respawning it once if it
+        was already dead.
+
+        The call first waits for a slot from the command's CallLimiter
+        (raising QueueFullError if its queue is full). A call is retried only
+        if it never reached the downstream (the process had exited, or the
+        request could not be written); a process dying mid-call and errors
+        reported by a live downstream are passed straight through, since the
+        tool may already have run.
+
+        If `trace` is given, per-phase seconds (queue_wait, spawn, initialize,
+        prepare, call) go into `trace["phases"]`, plus the queue depth and
+        whether a speculative server was hit.
+
+        `prepare`, if given, is awaited with the leased session before the
+        call (e.g. to discover its tools); if it returns a name, the call goes
+        to that downstream tool instead of `name`. Its failures are logged and
+        otherwise ignored.
+
+        `meta` is sent as the downstream request's `_meta` (e.g. trace context).
+        """
+        phases = trace.setdefault("phases", {}) if trace is not None else {}
+        limiter = self.limiter_for(cmd_hash, policy)
+        if limiter.depth or (limiter.max_concurrency and limiter.running >= limiter.max_concurrency):
+            # Calls are about to queue: add a replica if the policy allows
+            self._scale(cmd_hash, params, policy, pressure=True)
+        phases["queue_wait"] = await limiter.acquire(name)
+        if trace is not None:
+            trace["queue_depth"] = limiter.depth
+        try:
+            for attempt in range(2):
+                async with self.lease(cmd_hash, params, policy, phases) as active:
+                    if active.speculative:
+                        active.speculative = False
+                        self.speculation["hits"] += 1
+                        if trace is not None:
+                            trace["speculative_hit"] = True
+                    if prepare is not None:
+                        start = time.perf_counter()
+                        try:
+                            name = await prepare(active.session) or name
+                        except Exception as e:
+                            sys.stderr.write(f"Error preparing call to '{name}': {e!r}\n")
+                        phases["prepare"] = time.perf_counter() - start
+                        prepare = None
+                    start = time.perf_counter()
+                    # Whether the process was already gone before the request
+                    # went out; if it dies mid-call the tool may have run, so
+                    # that failure is reported rather than retried
+                    exited_before = active.exited.is_set()
+                    try:
+                        return await active.session.call_tool(name, arguments, meta=meta)
+                    except Exception as e:
+                        if attempt or not _never_sent(exited_before, e):
+                            raise
+                        sys.stderr.write(f"Downstream for '{name}' was gone before the call ({e!r}); respawning and retrying once\n")
+                    finally:
+                        phases["call"] = time.perf_counter() - start
+        finally:
+            limiter.release()
+
+    async def warm(self, cmd_hash: str, params: StdioServerParameters, policy: PoolPolicy,
+                   speculative_ttl: Optional[float] = None) -> bool:
+        """Start `cmd_hash` ahead of its first call. Returns False if it was already live.
+
+        With `speculative_ttl` the server is a guess: it is evicted if no call
+        uses it within that many seconds, and counted as a speculation hit or
+        miss accordingly.
+        """
+        if self.is_live(cmd_hash):
+            return False
+        if speculative_ttl is not None and not self._make_room(speculative=True):
+            # A guess may only displace other guesses, never a real server
+            return False
+        active = await self._spawn(cmd_hash, 0, params, policy)
+        if speculative_ttl is not None:
+            active.speculative = True
+            active.speculative_ttl = speculative_ttl
+            self.speculation["spawned"] += 1
+        self._scale(cmd_hash, params, policy)
+        return True
+
+    def warm_in_background(self, cmd_hash: str, params: StdioServerParameters, policy: PoolPolicy,
+                           speculative_ttl: Optional[float] = None):
+        async def _run():
+            try:
+                await self.warm(cmd_hash, params, policy, speculative_ttl)
+            except Exception as e:
+                sys.stderr.write(f"Error pre-starting {cmd_hash[:12]}: {e}\n")
+
+        task = asyncio.create_task(_run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def is_live(self, cmd_hash: str) -> bool:
+        """True if `cmd_hash` has a usable replica or one is being started."""
+        return bool(self.replicas_of(cmd_hash)) or replica_key(cmd_hash, 0) in self._spawning
+
+    def speculative_count(self) -> int:
+        return sum(1 for a in self.servers.values() if a.speculative)
+
+    def limiter_for(self, cmd_hash: str, policy: PoolPolicy) -> CallLimiter:
+        """The admission limiter for a command; it outlives respawns of the server.
+
+        Its concurrency limit is the per-replica limit times the live replicas.
+        """
+        limiter = self._limiters.get(cmd_hash)
+        if limiter is None:
+            limiter = self._limiters[cmd_hash] = CallLimiter(policy.max_concurrency, policy.max_queue)
+        self._resize_limiter(cmd_hash, policy)
+        return limiter
+
+    def _resize_limiter(self, cmd_hash: str, policy: PoolPolicy):
+        limiter = self._limiters.get(cmd_hash)
+        if limiter is None:
+            return
+        max_concurrency = policy.max_concurrency
+        if max_concurrency:
+            max_concurrency *= max(1, len(self.replicas_of(cmd_hash)))
+        if (limiter.max_concurrency, limiter.max_queue) != (max_concurrency, policy.max_queue):
+            limiter.configure(max_concurrency, policy.max_queue)
+
+    def limiters(self) -> Dict[str, CallLimiter]:
+        """CallLimiter per command hash, for reporting."""
+        return dict(self._limiters)
+
+    def replicas_of(self, cmd_hash: str):
+        return [a for a in self.servers.values() if a.command_hash == cmd_hash and a.is_usable]
+
+    @asynccontextmanager
+    async def lease(self, cmd_hash: str, params: StdioServerParameters, policy: PoolPolicy,
+                    phases: Optional[Dict[str, float]] = None):
+        """Yield the least-loaded live replica for `cmd_hash`, spawning one if needed.
+
+        When every live replica is already busy and the policy allows more,
+        another replica is started in the background for later calls. The
+        server is pinned against eviction for the duration of the lease. If
+        the caller had to wait for a cold start, its spawn and initialize
+        times are recorded in `phases`.
+        """
+        while True:
+            replicas = self.replicas_of(cmd_hash)
+            if replicas:
+                active = min(replicas, key=lambda a: a.in_flight)
+            else:
+                active = await self._spawn(cmd_hash, 0, params, policy)
+                if phases is not None:
+                    phases["spawn"] = active.spawn_time
+                    phases["initialize"] = active.init_time
+            self._scale(cmd_hash, params, policy, pressure=active.in_flight > 0)
+            # What we were handed may have been evicted or died while we
+            # waited on the spawn; if so, look again.
+            if active.is_usable:
+                break
+        self.servers.move_to_end(active.key)
+
+        active.in_flight += 1
+        try:
+            yield active
+        finally:
+            active.in_flight -= 1
+            active.last_used = time.monotonic()
+            if not active.in_flight:
+                if active.exited.is_set():
+                    self._stop(active)
+                elif active.policy.mode == MODE_EPHEMERAL:
+                    self.evict(active.key)
+
+    def _scale(self, cmd_hash: str, params: StdioServerParameters, policy: PoolPolicy, pressure: bool = False):
+        """Start replicas of `cmd_hash` in the background as the policy asks.
+
+        Always tops the command up to min_replicas; under `pressure` (calls
+        queueing, or every replica busy) adds one more, up to max_replicas.
+        Growth goes one replica at a time so a burst does not fork a process
+        per queued call. Surplus replicas are reclaimed by the idle reaper.
+        """
+        running = {a.replica for a in self.servers.values() if a.command_hash == cmd_hash}
+        starting = {r for r in range(policy.max_replicas) if replica_key(cmd_hash, r) in self._spawning}
+        taken = running | starting
+
+        want = policy.min_replicas
+        if pressure and not starting:
+            want = max(want, min(policy.max_replicas, len(taken) + 1))
+
+        for replica in range(policy.max_replicas):
+            if len(taken) >= want:
+                break
+            if replica not in taken:
+                self._spawn_in_background(cmd_hash, replica, params, policy)
+                taken.add(replica)
+
+    def _spawn_in_background(self, cmd_hash: str, replica: int, params: StdioServerParameters, policy: PoolPolicy):
+        async def _run():
+            try:
+                await self._spawn(cmd_hash, replica, params, policy)
+            except Exception as e:
+                sys.stderr.write(f"Error starting replica {replica} of {cmd_hash[:12]}: {e}\n")
+
+        task = asyncio.create_task(_run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _spawn(self, cmd_hash: str, replica: int, params: StdioServerParameters, policy: PoolPolicy) -> ActiveServer:
+        """Start a replica of `cmd_hash`, or join a start already in progress.
+
+        Concurrent callers for the same replica all await one shared future,
+        so a burst of calls to a cold tool spawns exactly one process. The
+        future is shielded: a caller being cancelled must not abort the spawn
+        the others are waiting on.
+        """
+        key = replica_key(cmd_hash, replica)
+        pending = self._spawning.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self._ensure_reaper()
+        self._make_room()
+
+        ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._spawning[key] = ready
+        task = asyncio.create_task(self._own(cmd_hash, replica, params, policy, ready))
+
+        def _register(fut: asyncio.Future):
+            self._spawning.pop(key, None)
+            if not fut.cancelled() and fut.exception() is None:
+                active = fut.result()
+                active.task = task
+                self.servers[key] = active
+                self._resize_limiter(cmd_hash, policy)
+                limiter = self._limiters.get(cmd_hash)
+                if limiter is not None and limiter.depth:
+                    self._scale(cmd_hash, params, policy, pressure=True)
+
+        # Register from a callback so the server lands in the pool even if
+        # the caller that started the spawn is cancelled meanwhile.
+        ready.add_done_callback(_register)
+        return await asyncio.shield(ready)
+
+    async def _own(self, cmd_hash: str, replica: int, params: StdioServerParameters, policy: PoolPolicy,
+                   ready: asyncio.Future):
+        stack = AsyncExitStack()
+        exited = asyncio.Event()
+        started = time.perf_counter()
+        try:
+            read, write = await stack.enter_async_context(stdio_client(params))
+            spawned = time.perf_counter()
+
+            # Splice a watcher between the transport and the session so a
+            # crashed process is noticed the moment its stdout closes, not on
+            # the next call that happens to use it.
+            forward, session_read = anyio.create_memory_object_stream(0)
+            tg = await stack.enter_async_context(anyio.create_task_group())
+            tg.start_soon(self._watch_transport, replica_key(cmd_hash, replica), read, forward, exited)
+            stack.callback(tg.cancel_scope.cancel)
+
+            session = await stack.enter_async_context(ClientSession(session_read, write))
+            await session.initialize()
+            initialized = time.perf_counter()
+        except BaseException as e:
+            self.lifecycle["spawn_failed"] += 1
+            await stack.aclose()
+            if not ready.done():
+                ready.set_exception(e)
+            return
+
+        active = ActiveServer(
+            process=None,  # stdio_client owns the process; the session is what we talk to
+            session=session,
+            command_hash=cmd_hash,
+            exit_stack=stack,
+            policy=policy,
+            replica=replica,
+            exited=exited,
+            spawn_time=spawned - started,
+            init_time=initialized - spawned,
+        )
+        self.lifecycle["spawned"] += 1
+        ready.set_result(active)
+        try:
+            await active.stop.wait()
+        finally:
+            try:
+                await stack.aclose()
+            except Exception as e:
+                sys.stderr.write(f"Error shutting down downstream {active.key[:12]}: {e}\n")
+
+    async def _watch_transport(self, key: str, read, forward, exited: asyncio.Event):
+        async with forward:
+            try:
+                async for message in read:
+                    await forward.send(message)
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                # Session side went away first: this is a normal teardown
+                return
+
+            # EOF from the process: mark it dead and drop it from the pool
+            # before the session sees the closed stream and fails its calls.
+            # Teardown waits for those calls to unwind (see lease), otherwise
+            # the session could be cancelled before it reports the failure.
+            exited.set()
+            active = self.servers.get(key)
+            if active is not None and active.exited is exited:
+                sys.stderr.write(f"Downstream {key[:12]} exited; evicting\n")
+                del self.servers[key]
+                self._resize_limiter(active.command_hash, active.policy)
+                if not active.in_flight:
+                    self._stop(active)
+
+    def _make_room(self, speculative: bool = False) -> bool:
+        """LRU-evict idle servers until there is room for one more; returns
+        whether there is.
+
+        Servers with in-flight calls and keep_warm servers are never chosen,
+        so the limit is soft when everything live is busy or pinned. Room for
+        a `speculative` start is only made by evicting other unused
+        speculative servers.
+        """
+        while len(self.servers) >= self.max_servers:
+            idle = [k for k, a in self.servers.items() if not a.in_flight and (a.speculative or not a.is_pinned)]
+            # Unused speculative servers go first, then plain LRU order
+            victim = next((k for k in idle if self.servers[k].speculative), None)
+            if victim is None and not speculative and idle:
+                victim = idle[0]
+            if victim is None:
+                return False
+            self.evict(victim)
+        return True
+
+    def evict(self, key: str):
+        """Drop a server from the pool and let its owner task tear it down."""
+        active = self.servers.pop(key, None)
+        if active is not None:
+            self._resize_limiter(active.command_hash, active.policy)
+            self._stop(active)
+
+    def _stop(self, active: ActiveServer):
+        if active.speculative:
+            active.speculative = False
+            self.speculation["misses"] += 1
+        self.lifecycle["stopped"] += 1
+        active.stop.set()
+        if active.task is not None and not active.task.done():
+            self._closing.add(active.task)
+            active.task.add_done_callback(self._closing.discard)
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            now = time.monotonic()
+            for key in [k for k, a in self.servers.items() if a.is_idle_expired(now)]:
+                self.evict(key)
+
+    async def close_all(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for task in list(self._background):
+            task.cancel()
+        for key in list(self.servers):
+            self.evict(key)
+        if self._closing:
+            await asyncio.gather(*list(self._closing), return_exceptions=True)
+
+
+def _never_sent(exited_before: bool, error: Exception) -> bool:
+    """True when a call failed because its session was dead before the
+    request went out: the process had already exited, or writing the
+    request hit a closed stream. Only then is a retry safe."""
+    if exited_before:
+        return True
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError))
@@ -0,0 +1,385 @@
+import asyncio
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from bm25 import BM25Index
+from filecache import FileCache
+from trigram import TrigramIndex, normalize
+
+# Relative weight of each field in ranked search
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+URL_WEIGHT = 1.0
+
+# Words that say nothing about what a server does
+_FILLER = {"mcp", "server", "servers", "model", "context", "protocol"}
+# Launchers whose first positional argument names the package
+_LAUNCHERS = {"npx", "uv", "uvx", "pipx", "node", "python", "python3", "docker", "bunx"}
+
+# Compiled registry, written next to community_servers.json (see compile_registry)
+COMPILED_SUFFIX = ".idx"
+_MAGIC = b"MCPREG01"
+# magic, source mtime_ns, source size, entry count
+_HEADER = struct.Struct("<8sQQI")
+# Per entry: (offset, length) of name, description, url, aliases, suggest
+# names and the full JSON entry, then flags
+_FIELDS = ("name", "description", "url", "aliases", "suggest")
+_RECORD = struct.Struct("<" + "II" * (len(_FIELDS) + 1) + "I")
+_HAS_COMMAND = 1
+# Separates list items (aliases, suggest names) inside one string field
+_SEP = "\x1f"
+
+
+def _url_path(url: str) -> str:
+    return url.split("://", 1)[-1].partition("/")[2]
+
+
+def _strip_filler(text: str) -> str:
+    return " ".join(w for w in normalize(text).split() if w not in _FILLER)
+
+
+def aliases(tool: Dict) -> List[str]:
+    """Other names an agent might use for `tool`.
+
+    Explicit `aliases` from the entry, plus its name, launched package and
+    repository name with filler like "mcp-server-" removed.
+    """
+    names = list(tool.get("aliases", []))
+    names.append(_strip_filler(tool["name"]))
+    command = tool.get("command") or []
+    if command and command[0] in _LAUNCHERS:
+        package = next((a for a in command[1:] if not a.startswith("-") and a != "run" and "$" not in a), "")
+        names.append(_strip_filler(package.rsplit("/", 1)[-1]))
+    url = tool.get("url", "").rstrip("/")
+    if url:
+        names.append(_strip_filler(url.rsplit("/", 1)[-1]))
+    return [n for n in names if n]
+
+
+class _JsonEntries:
+    """Registry entries parsed from community_servers.json."""
+
+    def __init__(self, tools: List[Dict]):
+        self.tools = tools
+        self._positions: Dict[str, int] = {}
+        for i, tool in enumerate(tools):
+            self._positions.setdefault(tool["name"], i)
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def close(self):
+        """Nothing to release; see CompiledEntries.close()."""
+
+    def field(self, i: int, name: str) -> str:
+        tool = self.tools[i]
+        if name == "aliases":
+            return _SEP.join(tool.get("aliases", []))
+        if name == "suggest":
+            return _SEP.join(aliases(tool))
+        return tool.get(name, "")
+
+    def has_command(self, i: int) -> bool:
+        return bool(self.tools[i].get("command"))
+
+    def entry(self, i: int) -> Dict:
+        return self.tools[i]
+
+    def find(self, name: str) -> Optional[int]:
+        return self._positions.get(name)
+
+
+class CompiledEntries:
+    """Registry entries read straight from a memory-mapped compiled registry.
+
+    Only the fixed-size record table and a sorted name table are touched to
+    look up a name; strings are decoded on access and full entries only
+    when asked for, so opening the registry costs next to nothing.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.source_mtime_ns, self.source_size, self._count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a compiled registry")
+        self._records = _HEADER.size
+        self._sorted = self._records + self._count * _RECORD.size
+        self._entries: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        """Unmap the file. Windows cannot replace a file while it is mapped,
+        so this must happen before the compiled registry is rewritten."""
+        if not self._map.closed:
+            self._map.close()
+
+    def _record(self, i: int) -> Tuple[int, ...]:
+        return _RECORD.unpack_from(self._map, self._records + i * _RECORD.size)
+
+    def _bytes(self, i: int, slot: int) -> bytes:
+        rec = self._record(i)
+        off, length = rec[2 * slot], rec[2 * slot + 1]
+        return self._map[off:off + length]
+
+    def field(self, i: int, name: str) -> str:
+        return self._bytes(i, _FIELDS.index(name)).decode("utf-8")
+
+    def has_command(self, i: int) -> bool:
+        return bool(self._record(i)[-1] & _HAS_COMMAND)
+
+    def entry(self, i: int) -> Dict:
+        entry = self._entries.get(i)
+        if entry is None:
+            entry = self._entries[i] = json.loads(self._bytes(i, len(_FIELDS)))
+        return entry
+
+    def find(self, name: str) -> Optional[int]:
+        """Binary search of the name table, comparing UTF-8 bytes."""
+        target = name.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = struct.unpack_from("<I", self._map, self._sorted + 4 * mid)[0]
+            if self._bytes(i, 0) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            i = struct.unpack_from("<I", self._map, self._sorted + 4 * lo)[0]
+            if self._bytes(i, 0) == target:
+                return i
+        return None
+
+
+def compile_registry(json_path: str, out_path: Optional[str] = None) -> str:
+    """Write the compiled form of `json_path` and return its path.
+
+    Layout: header, one fixed-size record per entry (offsets of its search
+    fields and compact JSON), entry numbers sorted by name, then the string
+    data. The header records the source's mtime and size so a stale file is
+    never used.
+    """
+    out_path = out_path or json_path + COMPILED_SUFFIX
+    st = os.stat(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        tools = json.load(f).get("tools", [])
+    source = _JsonEntries(tools)
+
+    data = bytearray()
+    base = _HEADER.size + len(tools) * (_RECORD.size + 4)
+    records = []
+    for i, tool in enumerate(tools):
+        slots = []
+        values = [source.field(i, name) for name in _FIELDS]
+        values.append(json.dumps(tool, separators=(",", ":")))
+        for value in values:
+            raw = value.encode("utf-8")
+            slots += [base + len(data), len(raw)]
+            data += raw
+        records.append(_RECORD.pack(*slots, _HAS_COMMAND if source.has_command(i) else 0))
+    # First entry of a duplicated name wins, as in the JSON index
+    order = sorted(range(len(tools)), key=lambda i: (tools[i]["name"].encode("utf-8"), i))
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, st.st_mtime_ns, st.st_size, len(tools)))
+        f.write(b"".join(records))
+        f.write(struct.pack(f"<{len(order)}I", *order))
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class RegistryIndex:
+    """One loaded version of community_servers.json.
+
+    Exact name lookups go straight to the entries. The case-insensitive name
+    index, the BM25 index over name, aliases, description and URL path, and
+    the trigram index for "did you mean" are built on first use. Entries are
+    shared; copy before mutating.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self._by_key: Optional[Dict[str, int]] = None
+        self._bm25: Optional[BM25Index] = None
+        self._names: Optional[TrigramIndex] = None
+        self._fields: Optional[List[Tuple[str, str]]] = None
+        # Loaded from the JSON because the compiled registry was missing or stale
+        self.needs_compile = False
+
+    def close(self):
+        self.entries.close()
+
+    @property
+    def by_key(self) -> Dict[str, int]:
+        """Case- and separator-insensitive names; runnable entries win ties."""
+        if self._by_key is None:
+            by_key: Dict[str, int] = {}
+            for i in range(len(self.entries)):
+                key = normalize(self.entries.field(i, "name"))
+                if key not in by_key or (self.entries.has_command(i) and not self.entries.has_command(by_key[key])):
+                    by_key[key] = i
+            self._by_key = by_key
+        return self._by_key
+
+    @property
+    def bm25(self) -> BM25Index:
+        if self._bm25 is None:
+            field = self.entries.field
+            self._bm25 = BM25Index()
+            self._bm25.fit([
+                [
+                    (field(i, "name"), NAME_WEIGHT),
+                    (field(i, "aliases").replace(_SEP, " "), NAME_WEIGHT),
+                    (field(i, "description"), DESCRIPTION_WEIGHT),
+                    # Host and scheme are the same for nearly every entry
+                    (_url_path(field(i, "url")), URL_WEIGHT),
+                ]
+                for i in range(len(self.entries))
+            ])
+        return self._bm25
+
+    @property
+    def names(self) -> TrigramIndex:
+        if self._names is None:
+            self._names = TrigramIndex()
+            for i in range(len(self.entries)):
+                name = self.entries.field(i, "name")
+                suggest = self.entries.field(i, "suggest")
+                self._names.add(name, [name] + (suggest.split(_SEP) if suggest else []))
+        return self._names
+
+    @property
+    def fields(self) -> List[Tuple[str, str]]:
+        """(lowercase name, lowercase description) per entry, for substring matching."""
+        if self._fields is None:
+            self._fields = [
+                (self.entries.field(i, "name").lower(), self.entries.field(i, "description").lower())
+                for i in range(len(self.entries))
+            ]
+        return self._fields
+
+    def get(self, name: str) -> Optional[Dict]:
+        """Entry named `name`, ignoring case and separators if there is no exact match."""
+        i = self.entries.find(name)
+        if i is None:
+            i = self.by_key.get(normalize(name))
+        return self.entries.entry(i) if i is not None else None
+
+    def did_you_mean(self, name: str, limit: int = 5) -> List[str]:
+        """Registry names most similar to a misspelled or abbreviated `name`."""
+        return [target for target, _ in self.names.similar(_strip_filler(name) or name, limit)]
+
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[int, List[Tuple[Dict, float]]]:
+        """Best matches for `query` as (entry, score), most relevant first, plus the total.
+
+        Ranked with BM25; when no term matches, falls back to entries whose
+        name or description contains the query as a substring. Only the
+        returned entries are decoded.
+        """
+        total, ranked = self.bm25.search(query, limit, offset)
+        if total:
+            return total, [(self.entries.entry(idx), score) for idx, score in ranked]
+        query = query.lower().strip()
+        if not query:
+            return 0, []
+        matches = [
+            i for i, (name, description) in enumerate(self.fields)
+            if query in name or query in description
+        ]
+        return len(matches), [(self.entries.entry(i), 0.0) for i in matches[offset:offset + limit]]
+
+
+def _open_compiled(path: str) -> Optional[CompiledEntries]:
+    compiled_path = path + COMPILED_SUFFIX
+    if not os.path.exists(compiled_path):
+        return None
+    try:
+        entries = CompiledEntries(compiled_path)
+    except (OSError, ValueError, struct.error) as e:
+        sys.stderr.write(f"Ignoring compiled registry {compiled_path}: {e}\n")
+        return None
+    st = os.stat(path)
+    if (entries.source_mtime_ns, entries.source_size) != (st.st_mtime_ns, st.st_size):
+        entries.close()
+        return None
+    return entries
+
+
+def _load(path: Optional[str]) -> RegistryIndex:
+    if not path:
+        return RegistryIndex(_JsonEntries([]))
+    entries = _open_compiled(path)
+    if entries is not None:
+        return RegistryIndex(entries)
+    with open(path, "r", encoding="utf-8") as f:
+        index = RegistryIndex(_JsonEntries(json.load(f).get("tools", [])))
+    # Missing or stale (e.g. after a checkout or hand edit): compiled for next
+    # time by CommunityRegistry once the previous index has been closed
+    index.needs_compile = True
+    return index
+
+
+class CommunityRegistry:
+    """The community server registry, loaded once and reloaded when the file changes.
+
+    Served from the memory-mapped compiled registry when it is up to date
+    with community_servers.json, else from the JSON itself. A refresh by
+    fetch_registry.py is picked up on the next lookup without restarting
+    the router.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cache = FileCache(path, _load, label="community registry", on_replace=RegistryIndex.close)
+        self._compiling: Optional[asyncio.Future] = None
+
+    def index(self) -> RegistryIndex:
+        index = self._cache.get()
+        if index.needs_compile:
+            # The index this one replaced is closed by now, so its mapping
+            # no longer holds the compiled file open
+            index.needs_compile = False
+            self._compile()
+        return index
+
+    def _compile(self):
+        """Compile the registry in a worker thread when called on an event
+        loop (the JSON is served meanwhile), else right away."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._compile_now()
+            return
+        if self._compiling is None or self._compiling.done():
+            self._compiling = loop.run_in_executor(None, self._compile_now)
+
+    def _compile_now(self):
+        try:
+            compile_registry(self.path)
+        except Exception as e:
+            sys.stderr.write(f"Error compiling community registry: {e}\n")
+
+    def get(self, name: str) -> Optional[Dict]:
+        return self.index().get(name)
+
+    def did_you_mean(self, name: str, limit: int = 5) -> List[str]:
+        return self.index().did_you_mean(name, limit)
+
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[int, List[Tuple[Dict, float]]]:
+        return self.index().search(query, limit, offset)
+
+
+if __name__ == "__main__":
+    # `python registry.py [community_servers.json]`: (re)build the compiled registry
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "community_servers.json")
+    print(f"Wrote {compile_registry(src)}")
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Disk tier of cached results, one directory per tool
+RESULT_CACHE_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")), "result_cache")
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """A manifest entry's `cache` settings.
+
+        "cache": {"ttl": 300, "max_entries": 256, "max_bytes": 1048576, "disk": false}
+
+    Results are kept for `ttl` seconds; each tool keeps at most
+    `max_entries` results and `max_bytes` of serialized content in memory,
+    evicting the least recently used. With "disk": true, results also go to
+    a disk tier (bounded by `disk_max_bytes`) that survives restarts.
+    """
+
+    ttl: float = 300.0
+    max_entries: int = 256
+    max_bytes: int = 1024 * 1024
+    disk: bool = False
+    disk_max_bytes: int = 16 * 1024 * 1024
+
+    @classmethod
+    def from_def(cls, tool_def: Dict) -> Optional["CachePolicy"]:
+        """The entry's policy, or None if it does not opt in."""
+        settings = tool_def.get("cache")
+        if not settings:
+            return None
+        if settings is True:
+            return cls()
+        return cls(
+            ttl=float(settings.get("ttl", cls.ttl)),
+            max_entries=int(settings.get("max_entries", cls.max_entries)),
+            max_bytes=int(settings.get("max_bytes", cls.max_bytes)),
+            disk=bool(settings.get("disk", cls.disk)),
+            disk_max_bytes=int(settings.get("disk_max_bytes", cls.disk_max_bytes)),
+        )
+
+
+def cache_key(scope: str, tool: str, arguments: Optional[Dict]) -> str:
+    """Stable key for a call: server identity, tool and canonical JSON arguments."""
+    canonical = json.dumps(arguments or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{scope}\0{tool}\0{canonical}".encode("utf-8")).hexdigest()
+
+
+class _Lru:
+    """One tool's in-memory entries: key -> (expires, size, value)."""
+
+    def __init__(self):
+        self.entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key: str, now: float) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self.pop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[2]
+
+    def put(self, key: str, expires: float, size: int, value: Any, policy: CachePolicy):
+        self.pop(key)
+        self.entries[key] = (expires, size, value)
+        self.bytes += size
+        while self.entries and (len(self.entries) > policy.max_entries or self.bytes > policy.max_bytes):
+            self.pop(next(iter(self.entries)))
+
+    def pop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+
+class ResultCache:
+    """Results of idempotent tool calls, for manifest entries that opt in.
+
+    Values are kept as given in memory; `dump` turns one into JSON-able
+    data (to size it and to write the disk tier) and `load` turns that back
+    into a value. Only the disk tier does file I/O: read_from_disk() and
+    put_on_disk() touch no in-memory state, so callers run them off the
+    event loop and everything else on it.
+    """
+
+    def __init__(self, dump: Callable[[Any], Any], load: Callable[[Any], Any], directory: str = RESULT_CACHE_DIR):
+        self.dump = dump
+        self.load = load
+        self.directory = directory
+        self._tools: Dict[str, _Lru] = {}
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    def get(self, tool: str, key: str, policy: CachePolicy, now: Optional[float] = None) -> Optional[Any]:
+        """The cached value from memory, or None (see read_from_disk())."""
+        now = time.time() if now is None else now
+        lru = self._tools.get(tool)
+        value = lru.get(key, now) if lru is not None else None
+        if value is not None:
+            self.stats["hits"] += 1
+        return value
+
+    def put(self, tool: str, key: str, value: Any, policy: CachePolicy, now: Optional[float] = None) -> Optional[str]:
+        """Cache `value` in memory; returns its serialized form if it should
+        also go to disk (pass it to put_on_disk())."""
+        now = time.time() if now is None else now
+        serialized = json.dumps(self.dump(value), separators=(",", ":"))
+        size = len(serialized)
+        self.stats["stores"] += 1
+        if size <= policy.max_bytes:
+            lru = self._tools.get(tool)
+            if lru is None:
+                lru = self._tools[tool] = _Lru()
+            lru.put(key, now + policy.ttl, size, value, policy)
+        return serialized if policy.disk else None
+
+    def _tool_dir(self, tool: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(tool.encode("utf-8")).hexdigest()[:16])
+
+    def read_from_disk(self, tool: str, key: str, now: Optional[float] = None) -> Optional[Tuple[float, int, Any]]:
+        """(expires, size, value) of an entry in the disk tier, or None on a
+        miss. Pass it to promote() to serve it."""
+        now = time.time() if now is None else now
+        path = os.path.join(self._tool_dir(tool), key + ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry["expires"] <= now:
+                os.remove(path)
+                return None
+            return entry["expires"], len(json.dumps(entry["value"])), self.load(entry["value"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            sys.stderr.write(f"Ignoring unreadable result cache entry {key[:12]}: {e}\n")
+            return None
+
+    def promote(self, tool: str, key: str, stored: Tuple[float, int, Any], policy: CachePolicy) -> Any:
+        """Move an entry read by read_from_disk() back into memory and return its value."""
+        expires, size, value = stored
+        lru = self._tools.get(tool)
+        if lru is None:
+            lru = self._tools[tool] = _Lru()
+        lru.put(key, expires, size, value, policy)
+        self.stats["disk_hits"] += 1
+        return value
+
+    def put_on_disk(self, tool: str, key: str, serialized: str, policy: CachePolicy, now: Optional[float] = None):
+        """Write one entry to the disk tier, then trim the tool's directory to
+        `disk_max_bytes`, dropping expired entries first and then the oldest."""
+        now = time.time() if now is None else now
+        directory = self._tool_dir(tool)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, key + ".json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write('{"expires":%r,"value":%s}' % (now + policy.ttl, serialized))
+        os.replace(tmp_path, path)
+
+        files = []
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(directory, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for mtime, size, name in sorted(files):
+            if total <= policy.disk_max_bytes and mtime + policy.ttl > now:
+                continue
+            try:
+                os.remove(os.path.join(directory, name))
+                total -= size
+            except OSError:
+                pass
+
+    def miss(self):
+        self.stats["misses"] += 1
@@ -7,10 +7,9 @@ import json
 import os
 import sys
 import time
-import hashlib
-import shutil
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass
+import copy
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 
 # Determine paths
 REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -23,71 +22,220 @@ COMMUNITY_PATH = os.path.join(os.path.dirname(__file__), "community_servers.json
 
 # Import MCP
 try:
-    from mcp.server import Server
-    from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource
+    from mcp.server import Server, NotificationOptions
     import mcp.types as types
+    from pydantic import TypeAdapter
     from mcp.server.stdio import stdio_server
-    from mcp.client.stdio import stdio_client, StdioServerParameters
-    from mcp.client.session import ClientSession
+    from mcp.client.stdio import StdioServerParameters
 except ImportError:
     sys.stderr.write("Error: mcp package not found.\n")
     sys.exit(1)
 
-server = Server("mcp-manager-router")
+from pool import DownstreamPool, MODE_EPHEMERAL
+import warmup
+import tool_envs
+from metrics import CallCounters, PhaseStats
+from metrics_http import Exposition, MetricsServer
+from tracing import Tracer
+from result_cache import CachePolicy, ResultCache, cache_key
+from filecache import FileCache
+from registry import CommunityRegistry
+from trigram import TrigramIndex
+from schemas import SchemaCache, schema_key
+from routing import Route, build_routes, launch_defs
+from launch import LaunchPlanner
+from usage_log import UsageLogWriter, iter_entries, query_entries
+from usage_stats import UsageStats
+
+# Downstream pool limits (overridable from the environment)
+MAX_LIVE_SERVERS = int(os.environ.get("MCP_ROUTER_MAX_SERVERS", "8"))
+DEFAULT_IDLE_TTL = float(os.environ.get("MCP_ROUTER_IDLE_TTL", "600"))
+
+# Startup pre-warming from logs/usage.jsonl (top-K 0 disables it)
+PREWARM_TOP_K = int(os.environ.get("MCP_ROUTER_PREWARM_TOP_K", "3"))
+PREWARM_LOOKBACK = float(os.environ.get("MCP_ROUTER_PREWARM_LOOKBACK_HOURS", "168")) * 3600
+PREWARM_RANK_BY = os.environ.get("MCP_ROUTER_PREWARM_BY", warmup.RANK_BY_FREQUENCY)
+
+# Speculative spawning of the tool most likely to be called next
+# (threshold is the minimum transition probability; budget 0 disables it)
+SPECULATE_THRESHOLD = float(os.environ.get("MCP_ROUTER_SPECULATE_THRESHOLD", "0.5"))
+SPECULATE_BUDGET = int(os.environ.get("MCP_ROUTER_SPECULATE_BUDGET", "2"))
+SPECULATE_TTL = float(os.environ.get("MCP_ROUTER_SPECULATE_TTL", "120"))
+
+# Batched background writes to logs/usage.jsonl
+LOG_BATCH_SIZE = int(os.environ.get("MCP_ROUTER_LOG_BATCH", "64"))
+LOG_FLUSH_INTERVAL = float(os.environ.get("MCP_ROUTER_LOG_FLUSH_MS", "200")) / 1000
+LOG_MAX_QUEUE = int(os.environ.get("MCP_ROUTER_LOG_MAX_QUEUE", "10000"))
+# Rotate usage.jsonl into compressed segments past this size or age; drop old segments
+LOG_MAX_BYTES = int(float(os.environ.get("MCP_ROUTER_LOG_MAX_MB", "5")) * 1024 * 1024)
+LOG_MAX_AGE = float(os.environ.get("MCP_ROUTER_LOG_MAX_AGE_HOURS", "24")) * 3600
+LOG_RETENTION = float(os.environ.get("MCP_ROUTER_LOG_RETENTION_DAYS", "90")) * 86400
+# Seconds of log per block of the sidecar index query_usage seeks by
+LOG_INDEX_BUCKET = float(os.environ.get("MCP_ROUTER_LOG_INDEX_BUCKET", "60"))
+
+# Rolling usage aggregates, snapshotted to logs/usage_stats.json for the dashboard
+STATS_FILE = os.path.join(LOGS_DIR, "usage_stats.json")
+STATS_WINDOWS = [float(w) for w in os.environ.get("MCP_ROUTER_STATS_WINDOWS", "300,3600,86400").split(",") if w.strip()]
+STATS_INTERVAL = float(os.environ.get("MCP_ROUTER_STATS_INTERVAL", "5"))
+
+# Prometheus endpoint: off unless a port (or a Unix socket path) is set
+METRICS_PORT = int(os.environ.get("MCP_ROUTER_METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("MCP_ROUTER_METRICS_HOST", "127.0.0.1")
+METRICS_SOCKET = os.environ.get("MCP_ROUTER_METRICS_SOCKET", "")
+
+# Trace spans of routed calls (sample rate 0 disables tracing)
+TRACE_SAMPLE = float(os.environ.get("MCP_ROUTER_TRACE_SAMPLE", "0"))
+TRACE_FILE = os.environ.get("MCP_ROUTER_TRACE_FILE", os.path.join(LOGS_DIR, "traces.jsonl"))
+TRACE_ENDPOINT = os.environ.get("MCP_ROUTER_TRACE_ENDPOINT", "")
+
+# Downstream tool schemas learned via list_tools() are re-discovered after this long
+SCHEMA_TTL = float(os.environ.get("MCP_ROUTER_SCHEMA_TTL_HOURS", "168")) * 3600
 
-@dataclass
-class ActiveServer:
-    process: Any
-    session: ClientSession
-    command_hash: str
-    exit_stack: Any
+# Default page size of search_mcp_servers results
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+# Default and maximum number of entries query_usage returns
+QUERY_DEFAULT_LIMIT = 50
+QUERY_MAX_LIMIT = 500
+
+# Tools implemented by the router itself
+INTERNAL_TOOLS = ("configure_mcp_tool", "search_mcp_servers", "log_activity", "usage_stats", "query_usage")
+
+server = Server("mcp-manager-router")
 
 # Global state for active downstream servers
-# Map command_hash -> ActiveServer
-active_servers: Dict[str, ActiveServer] = {}
+pool = DownstreamPool(max_servers=MAX_LIVE_SERVERS, default_idle_ttl=DEFAULT_IDLE_TTL)
+# Map command_hash -> ActiveServer, least recently used first
+active_servers = pool.servers
+# Learned tool-to-tool transitions, seeded from the usage log at startup
+transitions = warmup.TransitionModel()
+# Per-tool latency histograms for each phase of a routed call
+phase_stats = PhaseStats()
+# Routed calls and errors per tool, for the metrics endpoint
+call_counters = CallCounters()
+# Sampled spans of routed calls, exported in batches
+tracer = Tracer(TRACE_FILE, TRACE_SAMPLE, TRACE_ENDPOINT)
+# Results of calls to entries with a "cache" policy
+_content_adapter = TypeAdapter(List[types.ContentBlock])
+result_cache = ResultCache(
+    dump=lambda content: _content_adapter.dump_python(content, mode="json", by_alias=True, exclude_none=True),
+    load=_content_adapter.validate_python,
+)
+# Community server registry, indexed in memory and reloaded when the file changes
+registry = CommunityRegistry(COMMUNITY_PATH)
+# Real tool names and schemas reported by downstream servers
+schema_cache = SchemaCache(ttl=SCHEMA_TTL)
+# Resolved argv/env/pool key per manifest server, compiled when the manifest loads
+launch_plans = LaunchPlanner(REPO_ROOT)
+# Appends to LOG_FILE off the event loop
+usage_log = UsageLogWriter(LOG_FILE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_MAX_QUEUE,
+                           max_bytes=LOG_MAX_BYTES, max_age=LOG_MAX_AGE, retention=LOG_RETENTION,
+                           index_bucket=LOG_INDEX_BUCKET)
+# Totals and rolling windows of what usage_log writes
+usage_stats = UsageStats(STATS_FILE, STATS_WINDOWS, STATS_INTERVAL)
 
-def get_command_hash(command: List[str], env: Dict[str, str]) -> str:
-    # Include env in hash to ensure config changes trigger new servers
-    data = json.dumps({"cmd": command, "env": env}, sort_keys=True)
-    return hashlib.sha256(data.encode()).hexdigest()
+class ManifestIndex:
+    """One parsed version of the user manifest, with its routing table.
 
-def load_manifest() -> Dict:
+    Treat as read-only: it is shared by every call until the file changes.
+    The routing table also depends on discovered schemas (prefix entries),
+    so it is rebuilt lazily after refresh().
+    """
+
+    def __init__(self, manifest: Dict):
+        self.manifest = manifest
+        self._routes: Optional[Dict[str, Route]] = None
+        # list_tools() response for this version, built on first use
+        self.tool_list: Optional[List[types.Tool]] = None
+        self._names: Optional[TrigramIndex] = None
+
+    @property
+    def routes(self) -> Dict[str, Route]:
+        """Exposed tool name -> Route."""
+        if self._routes is None:
+            self._routes = build_routes(self.manifest, lambda server_def: schema_cache.tools(schema_key(server_def)))
+        return self._routes
+
+    def refresh(self):
+        """Drop everything derived from discovered schemas."""
+        self._routes = None
+        self.tool_list = None
+        self._names = None
+
+    def did_you_mean(self, name: str, limit: int = 5) -> List[str]:
+        """Configured tool names most similar to `name`."""
+        if self._names is None:
+            self._names = TrigramIndex()
+            for tool_name, route in self.routes.items():
+                self._names.add(tool_name, [tool_name] + route.definition.get("aliases", []))
+        return [target for target, _ in self._names.similar(name, limit)]
+
+def _parse_manifest(path: Optional[str]) -> ManifestIndex:
     manifest = {"tools": []}
     
     # 1. Load User Manifest (Priority)
     # Only return tools explicitly configured/installed by the user
-    if os.path.exists(MANIFEST_PATH):
+    if path:
+        with open(path, "r") as f:
+            user_manifest = json.load(f)
+            manifest["tools"].extend(user_manifest.get("tools", []))
+            manifest["servers"] = user_manifest.get("servers", {})
+
+    # Compile every server's launch plan up front; calls then just look it up
+    launch_plans.clear()
+    for label, server_def in launch_defs(manifest):
         try:
-            with open(MANIFEST_PATH, "r") as f:
-                user_manifest = json.load(f)
-                manifest["tools"].extend(user_manifest.get("tools", []))
+            launch_plans.plan_for(server_def)
         except Exception as e:
-            sys.stderr.write(f"Error loading user manifest: {e}\n")
+            sys.stderr.write(f"Error resolving launch of '{label}': {e}\n")
             
-    return manifest
+    return ManifestIndex(manifest)
+
+# Re-parsed only when router_manifest.json's mtime or size changes
+_manifest_cache = FileCache(MANIFEST_PATH, _parse_manifest, label="user manifest")
+
+def manifest_index() -> ManifestIndex:
+    return _manifest_cache.get()
+
+def load_manifest() -> Dict:
+    return manifest_index().manifest
 
 def get_community_tool(name: str) -> Optional[Dict]:
-    """Helper to find a tool in the community registry without loading all of them."""
-    if os.path.exists(COMMUNITY_PATH):
-        try:
-            with open(COMMUNITY_PATH, "r") as f:
-                community = json.load(f)
-                return next((t for t in community.get("tools", []) if t["name"] == name), None)
-        except Exception as e:
-            sys.stderr.write(f"Error reading community registry: {e}\n")
-    return None
+    """Helper to find a tool in the community registry by name (case and separators ignored)."""
+    return registry.get(name)
 
-def expand_vars(text: str) -> str:
-    """Expand environment variables in format ${VAR} or $VAR"""
-    return os.path.expandvars(text)
+def did_you_mean(name: str, limit: int = 5) -> List[str]:
+    """Configured, then registry, tool names similar to a misspelled `name`."""
+    names = manifest_index().did_you_mean(name, limit) + registry.did_you_mean(name, limit)
+    return list(dict.fromkeys(names))[:limit]
 
-@server.list_tools()
-async def list_tools() -> List[types.Tool]:
-    manifest = load_manifest()
-    tools = []
-    
-    # Add Router Internal Tools
-    tools.append(types.Tool(
+def parse_time(value) -> Optional[float]:
+    """Unix seconds from a number or an ISO 8601 string (UTC if no offset given)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def resolve_launch(tool_def: Dict) -> Tuple[str, StdioServerParameters]:
+    """The pool key and stdio parameters to start a manifest entry's server.
+
+    Served from its precompiled LaunchPlan; see launch.py.
+    """
+    plan = launch_plans.plan_for(tool_def)
+    return plan.key, plan.params
+
+# Router Internal Tools, built once
+INTERNAL_TOOL_DEFS = [
+    types.Tool(
         name="configure_mcp_tool",
         description="Install or Configure an MCP tool. Use this to permanently add a tool from the registry to the manifest, or to save environment variables (like API keys).",
         inputSchema={
@@ -102,21 +250,21 @@ async def list_tools() -> List[types.Tool]:
             },
             "required": ["name"]
         }
-    ))
-    
-    tools.append(types.Tool(
+    ),
+    types.Tool(
         name="search_mcp_servers",
         description="CRITICAL: Use this tool whenever you lack the necessary tools, skills, or knowledge to complete a user request. It searches the expanded MCP registry to find and install new capabilities (e.g. 'browser', 'database', 'slack') on the fly.",
         inputSchema={
             "type": "object",
             "properties": {
-                "query": {"type": "string", "description": "Search query for the missing capability (e.g. 'weather', 'database', 'browser')"}
+                "query": {"type": "string", "description": "Search query for the missing capability (e.g. 'weather', 'database', 'browser'). Several words are ranked together."},
+                "limit": {"type": "integer", "description": f"Maximum results to return (default {SEARCH_DEFAULT_LIMIT}, at most {SEARCH_MAX_LIMIT})"},
+                "offset": {"type": "integer", "description": "Number of top results to skip, for paging (default 0)"}
             },
             "required": ["query"]
         }
-    ))
-
-    tools.append(types.Tool(
+    ),
+    types.Tool(
         name="log_activity",
         description="Log a platform-native activity (e.g. web search, file system action) that bypasses MCP for accountability in the dashboard.",
         inputSchema={
@@ -127,18 +275,58 @@ async def list_tools() -> List[types.Tool]:
             },
             "required": ["activity", "details"]
         }
-    ))
+    ),
+    types.Tool(
+        name="usage_stats",
+        description="Summarize tool usage: all-time call and error counts per tool, and calls, success rates and latency percentiles over recent rolling windows.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "tool": {"type": "string", "description": "Optional: only report this tool"},
+                "window": {"type": "string", "description": "Optional: only report this window (e.g. '5m', '1h', '24h')"}
+            }
+        }
+    ),
+    types.Tool(
+        name="query_usage",
+        description="Look up logged tool calls, newest first: e.g. everything a tool did in the last hour, or recent failures.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "since": {"type": ["number", "string"], "description": "Optional: earliest call time, as Unix seconds or ISO 8601 (UTC unless it carries an offset)"},
+                "until": {"type": ["number", "string"], "description": "Optional: latest call time, same formats"},
+                "tool": {"type": "string", "description": "Optional: only calls of this tool"},
+                "success": {"type": "boolean", "description": "Optional: only successful (true) or failed (false) calls"},
+                "limit": {"type": "integer", "description": f"Maximum entries to return (default {QUERY_DEFAULT_LIMIT}, at most {QUERY_MAX_LIMIT})"}
+            }
+        }
+    )
+]
+
+@server.list_tools()
+async def list_tools() -> List[types.Tool]:
+    index = manifest_index()
+    if index.tool_list is not None:
+        return index.tool_list
 
-    for tool_def in manifest.get("tools", []):
-         # If strict, we might need to conform to types.Tool inputSchema structure
-         # For now, pass through
+    tools = list(INTERNAL_TOOL_DEFS)
+    for route in index.routes.values():
+        # Prefer what the server itself reported over the manifest's copy
+        discovered = schema_cache.downstream_tool(schema_key(route.server), route.tool or route.name) or {}
         tools.append(
             types.Tool(
-                name=tool_def["name"],
-                description=tool_def.get("description", ""),
-                inputSchema=tool_def.get("inputSchema", {})
+                name=route.name,
+                description=discovered.get("description") or route.definition.get("description", ""),
+                inputSchema=discovered.get("inputSchema") or route.definition.get("inputSchema", {})
             )
         )
+    index.tool_list = tools
+
+    # Prefix entries only list tools once their server is known; learn them now
+    for server_name in {t["server"] for t in index.manifest["tools"] if "prefix" in t and "server" in t}:
+        server_def = index.manifest["servers"].get(server_name)
+        if server_def and schema_cache.needs_discovery(schema_key(server_def)):
+            schedule_discovery(server_name, server_def)
     return tools
 
 @server.call_tool()
@@ -158,24 +346,31 @@ async def call_tool(name: str, arguments: dict) -> List[types.TextContent | type
                 except:
                     pass
             
-            # 2. Find tool in User Manifest, or copy from Community
-            tool_entry = next((t for t in user_manifest["tools"] if t["name"] == tool_name), None)
-            
-            if not tool_entry:
+            # 2. Find what serves the tool: a named server, its own entry, or
+            # failing that a copy from Community
+            user_manifest.setdefault("tools", [])
+            route = manifest_index().routes.get(tool_name)
+            if route is not None and route.server_name is not None:
+                # Servers layout: env belongs to the server, shared by all its tools
+                tool_entry = user_manifest.setdefault("servers", {}).get(route.server_name)
+            else:
+                tool_entry = next(
+                    (t for t in user_manifest["tools"] if t.get("name") == tool_name and "server" not in t), None
+                )
+
+            if not tool_entry and route is None:
                 # Look in Community
-                if os.path.exists(COMMUNITY_PATH):
-                    with open(COMMUNITY_PATH, "r") as f:
-                        community = json.load(f)
-                        comm_tool = next((t for t in community["tools"] if t["name"] == tool_name), None)
-                        if comm_tool:
-                            # Copy to User Manifest
-                            tool_entry = comm_tool.copy()
-                            user_manifest["tools"].append(tool_entry)
+                comm_tool = registry.get(tool_name)
+                if comm_tool:
+                    # Copy to User Manifest (the registry entry itself is shared)
+                    tool_entry = copy.deepcopy(comm_tool)
+                    user_manifest["tools"].append(tool_entry)
             
             if not tool_entry:
                 return [types.TextContent(type="text", text=f"Error: Tool '{tool_name}' not found in registry.")]
             
             # 3. Update Env
+            previous_key = schema_key(tool_entry)
             if "env" not in tool_entry:
                 tool_entry["env"] = {}
             tool_entry["env"].update(new_env)
@@ -183,6 +378,13 @@ async def call_tool(name: str, arguments: dict) -> List[types.TextContent | type
             # 4. Save
             with open(MANIFEST_PATH, "w") as f:
                 json.dump(user_manifest, f, indent=2)
+            _manifest_cache.invalidate()
+
+            # 5. Prebuild its environment so later spawns skip uv resolution
+            schedule_env_build(tool_entry.get("command", []))
+            # New env may mean a different server; learn its tools afresh
+            schema_cache.invalidate(previous_key)
+            schema_cache.invalidate(schema_key(tool_entry))
                 
             return [types.TextContent(type="text", text=f"Successfully configured and saved settings for '{tool_name}'.")]
             
@@ -191,23 +393,30 @@ async def call_tool(name: str, arguments: dict) -> List[types.TextContent | type
 
     if name == "search_mcp_servers":
         try:
-            query = arguments["query"].lower()
+            query = arguments["query"]
+            limit = max(1, min(int(arguments.get("limit") or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT))
+            offset = max(0, int(arguments.get("offset") or 0))
             results = []
             
-            # Load Registry
-            if os.path.exists(COMMUNITY_PATH):
-                with open(COMMUNITY_PATH, "r") as f:
-                    community = json.load(f)
-                    for tool in community.get("tools", []):
-                        if query in tool["name"].lower() or query in tool.get("description", "").lower():
-                            results.append({
-                                "name": tool["name"],
-                                "description": tool.get("description", ""),
-                                "command_preview": " ".join(tool["command"]),
-                                "inputSchema": tool.get("inputSchema", {})
-                            })
+            total, ranked = registry.search(query, limit, offset)
+            for tool, score in ranked:
+                result = {
+                    "name": tool["name"],
+                    "description": tool.get("description", ""),
+                    "url": tool.get("url", ""),
+                    "score": round(score, 3),
+                }
+                # Most registry entries have neither; leave them out to keep results short
+                if tool.get("command"):
+                    result["command_preview"] = " ".join(tool["command"])
+                if tool.get("inputSchema"):
+                    result["inputSchema"] = tool["inputSchema"]
+                results.append(result)
             
-            return [types.TextContent(type="text", text=json.dumps(results, indent=2))]
+            response = {"query": query, "total": total, "offset": offset, "results": results}
+            if not total:
+                response["did_you_mean"] = registry.did_you_mean(query)
+            return [types.TextContent(type="text", text=json.dumps(response, indent=2))]
         except Exception as e:
             return [types.TextContent(type="text", text=f"Error searching registry: {e}")]
 
@@ -224,100 +433,122 @@ async def call_tool(name: str, arguments: dict) -> List[types.TextContent | type
                 "duration": 0,
                 "details": details
             }
-            with open(LOG_FILE, "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry) + "\n")
+            usage_log.write(json.dumps(log_entry) + "\n", log_entry)
+            usage_stats.record(log_entry)
                 
             return [types.TextContent(type="text", text=f"Successfully logged activity: {activity}")]
         except Exception as e:
             return [types.TextContent(type="text", text=f"Error logging activity: {e}")]
 
+    if name == "query_usage":
+        try:
+            since = parse_time(arguments.get("since"))
+            until = parse_time(arguments.get("until"))
+            limit = max(1, min(int(arguments.get("limit") or QUERY_DEFAULT_LIMIT), QUERY_MAX_LIMIT))
+            # Make what was logged so far visible to the query
+            await usage_log.flush()
+            entries = await asyncio.to_thread(
+                query_entries, LOG_FILE, since or 0.0, until, arguments.get("tool"), arguments.get("success"), limit
+            )
+            return [types.TextContent(type="text", text=json.dumps({"count": len(entries), "entries": entries}, indent=2))]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Error querying usage log: {e}")]
+
+    if name == "usage_stats":
+        try:
+            stats = usage_stats.snapshot(arguments.get("tool"))
+            window = arguments.get("window")
+            if window:
+                if window not in stats["windows"]:
+                    return [types.TextContent(type="text", text=f"Error: unknown window '{window}'. Available: {', '.join(stats['windows'])}")]
+                stats["windows"] = {window: stats["windows"][window]}
+            return [types.TextContent(type="text", text=json.dumps(stats, indent=2))]
+        except Exception as e:
+            return [types.TextContent(type="text", text=f"Error reading usage stats: {e}")]
 
-    manifest = load_manifest()
-    tool_def = next((t for t in manifest.get("tools", []) if t["name"] == name), None)
+
+    start_time = time.time()
+    resolve_start = time.perf_counter()
+    span = tracer.start(name, incoming_traceparent())
+    index = manifest_index()
+    route = index.routes.get(name)
     
     # Lazy Load: If not in manifest, check community registry
-    if not tool_def:
+    if not route:
         tool_def = get_community_tool(name)
+        if tool_def:
+            # A case/separator-insensitive registry match is called by its real name
+            name = tool_def["name"]
+            route = Route(name, tool_def, None, tool_def)
     
-    start_time = time.time()
     success = False
     error_msg = None
+    # Per-phase timings and call details, logged with the call
+    trace = {"phases": {}}
+    if span is not None:
+        span.name = f"call_tool {name}"
+        span.attributes["mcp.tool"] = name
+        trace["trace_id"] = span.trace_id
 
-    if not tool_def:
-        return [types.TextContent(type="text", text=f"Tool {name} not found in user manifest or community registry.")]
-
-    command = tool_def["command"]
-    
-    # Resolve absolute paths and expand variables in command
-    final_cmd = []
-    for i, part in enumerate(command):
-        # Expand vars first (e.g. ${DB_PATH})
-        expanded_part = expand_vars(part)
-        
-        # Check for absolute paths relative to repo root
-        possible_path = os.path.join(REPO_ROOT, expanded_part)
-        if os.path.exists(possible_path):
-             final_cmd.append(possible_path)
-        else:
-             # Logic for executable resolution (first arg)
-             if i == 0 and not os.path.isabs(expanded_part):
-                 resolved = shutil.which(expanded_part)
-                 if resolved:
-                     final_cmd.append(resolved)
-                 else:
-                     final_cmd.append(expanded_part)
-             else:
-                 final_cmd.append(expanded_part)
-    
-    # ENV preparation
-    env = os.environ.copy()
-    if tool_def.get("env"):
-        env.update(tool_def["env"])
-    env["PYTHONUNBUFFERED"] = "1"
-    
-    # Calculate hash including env
-    cmd_hash = get_command_hash(final_cmd, env)
+    if not route:
+        message = f"Tool {name} not found in user manifest or community registry."
+        suggestions = did_you_mean(name)
+        if suggestions:
+            message += f" Did you mean: {', '.join(suggestions)}?"
+        if span is not None:
+            tracer.finish(span, trace["phases"], message)
+        return [types.TextContent(type="text", text=message)]
 
     try:
-        session = None
-        
-        # 1. Check if server is already running
-        if cmd_hash in active_servers:
-            session = active_servers[cmd_hash].session
-        else:
-            # 2. Start new server
-            # We use mcp.client.stdio to manage the connection
-            # We need to manually manage the exit stack context to keep it alive
-            from contextlib import AsyncExitStack
-            stack = AsyncExitStack()
-            
-            # Create params
-            server_params = StdioServerParameters(
-                command=final_cmd[0],
-                args=final_cmd[1:],
-                env=env
-            )
-            
-            # Connect
-            read, write = await stack.enter_async_context(stdio_client(server_params))
-            session = await stack.enter_async_context(ClientSession(read, write))
-            await session.initialize()
-            
-            # Store
-            active_servers[cmd_hash] = ActiveServer(
-                process=None, # stdio_client manages process internally or we don't access it easily, but session is what matters
-                session=session,
-                command_hash=cmd_hash,
-                exit_stack=stack
-            )
-
-        # 3. Call Tool via JSON-RPC
-        # We assume the downstream server exposes the tool with the SAME Name.
-        # If the manifest name is just an alias, we should fail or have a mapping.
-        # For now, we assume direct mapping.
-        result = await session.call_tool(name, arguments)
+        # Reuse the pooled server for this command, or start it; every tool
+        # routed to the same server shares it. The pool evicts it again once
+        # it sits idle past its TTL.
+        server_def = route.server
+        cmd_hash, server_params = resolve_launch(server_def)
+        trace["phases"]["resolve"] = time.perf_counter() - resolve_start
+        speculate_next(name, index)
+        # Call Tool via JSON-RPC, under the downstream name from the route, or
+        # else as reported by the server (the same name unless the manifest
+        # entry just labels a single-tool server).
+        # Servers not discovered yet (or past SCHEMA_TTL) list their tools first.
+        # A downstream that crashed is respawned and the call retried once.
+        key = schema_key(server_def)
+        downstream_name = route.tool
+        if downstream_name is None:
+            discovered = schema_cache.downstream_tool(key, name)
+            downstream_name = discovered["name"] if discovered else name
+        # Opted-in entries answer repeated calls from the result cache
+        cache_policy = CachePolicy.from_def(route.definition) or CachePolicy.from_def(server_def)
+        if cache_policy is not None:
+            cached_key = cache_key(key, name, arguments)
+            cached = result_cache.get(name, cached_key, cache_policy)
+            trace["cache"] = "hit"
+            if cached is None and cache_policy.disk:
+                stored = await asyncio.to_thread(result_cache.read_from_disk, name, cached_key)
+                if stored is not None:
+                    # Back on the loop: only it touches the in-memory tier
+                    cached = result_cache.promote(name, cached_key, stored, cache_policy)
+                trace["cache"] = "disk_hit"
+            if cached is None:
+                trace["cache"] = "miss"
+            if cached is not None:
+                success = True
+                return cached
+            result_cache.miss()
+        prepare = None
+        if schema_cache.needs_discovery(key):
+            prepare = lambda session: discover_tools(session, key, server_def, route.tool or name)
+        result = await pool.call_tool(
+            cmd_hash, server_params, pool.policy_for(server_def),
+            downstream_name, arguments, trace, prepare,
+            meta=span.downstream_meta() if span is not None else None,
+        )
         
         success = True
+        if cache_policy is not None and not result.isError:
+            serialized = result_cache.put(name, cached_key, result.content, cache_policy)
+            if serialized is not None:
+                schedule_cache_write(name, cached_key, serialized, cache_policy)
         return result.content
 
     except Exception as e:
@@ -327,6 +558,9 @@ async def call_tool(name: str, arguments: dict) -> List[types.TextContent | type
     finally:
         duration = time.time() - start_time
         try:
+            if span is not None:
+                span.attributes["mcp.success"] = success
+                tracer.finish(span, trace["phases"], error_msg)
             log_entry = {
                 "timestamp": time.time(),
                 "iso_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
@@ -335,14 +569,330 @@ async def call_tool(name: str, arguments: dict) -> List[types.TextContent | type
                 "duration": duration,
                 "error": error_msg
             }
-            with open(LOG_FILE, "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry) + "\n")
+            log_entry.update(trace)
+            serialize_start = time.perf_counter()
+            line = json.dumps(log_entry) + "\n"
+            # Serializing the record is the one phase that can't be in it
+            phase_stats.record_all(name, trace["phases"])
+            phase_stats.record(name, "serialize", time.perf_counter() - serialize_start)
+            call_counters.record(name, success)
+            usage_log.write(line, log_entry)
+            usage_stats.record(log_entry)
         except:
             pass
 
+_cache_writes: set = set()
+
+def schedule_cache_write(name: str, key: str, serialized: str, policy: CachePolicy):
+    """Write a result to the disk tier in the background."""
+    async def _run():
+        try:
+            await asyncio.to_thread(result_cache.put_on_disk, name, key, serialized, policy)
+        except OSError as e:
+            sys.stderr.write(f"Error writing result cache for '{name}': {e}\n")
+    task = asyncio.create_task(_run())
+    _cache_writes.add(task)
+    task.add_done_callback(_cache_writes.discard)
+
+def incoming_traceparent() -> Optional[str]:
+    """W3C traceparent the client sent in the current request's `_meta`, if any."""
+    try:
+        meta = server.request_context.meta
+    except LookupError:
+        return None
+    return getattr(meta, "traceparent", None) if meta is not None else None
+
+async def list_downstream_tools(session) -> List[Dict]:
+    """All tools a downstream session exposes, following pagination."""
+    tools = []
+    cursor = None
+    while True:
+        listed = await session.list_tools(cursor)
+        tools.extend(
+            {"name": t.name, "description": t.description or "", "inputSchema": t.inputSchema}
+            for t in listed.tools
+        )
+        cursor = listed.nextCursor
+        if not cursor:
+            return tools
+
+async def discover_tools(session, key: str, server_def: Dict, name: Optional[str] = None,
+                         client=None) -> Optional[str]:
+    """Cache the tools of a freshly used server. Returns the downstream name for tool `name`."""
+    schema_cache.store(key, server_def.get("command", []), await list_downstream_tools(session))
+    # Rebuild routes and list_tools() with the real schemas and tell the client they changed
+    manifest_index().refresh()
+    try:
+        client = client or server.request_context.session
+        await client.send_tool_list_changed()
+    except Exception:
+        pass
+    match = schema_cache.downstream_tool(key, name) if name else None
+    return match["name"] if match else None
+
+_discoveries: Dict[str, asyncio.Task] = {}
+
+def schedule_discovery(label: str, server_def: Dict):
+    """Start `server_def` in the background and learn its tools."""
+    key = schema_key(server_def)
+    if key in _discoveries and not _discoveries[key].done():
+        return
+    try:
+        client = server.request_context.session
+    except LookupError:
+        client = None
+
+    async def _discover():
+        try:
+            cmd_hash, server_params = resolve_launch(server_def)
+            async with pool.lease(cmd_hash, server_params, pool.policy_for(server_def)) as active:
+                await discover_tools(active.session, key, server_def, client=client)
+            sys.stderr.write(f"Discovered tools of server '{label}'\n")
+        except Exception as e:
+            sys.stderr.write(f"Error discovering tools of server '{label}': {e}\n")
+
+    _discoveries[key] = asyncio.create_task(_discover())
+
+def speculate_next(name: str, index: ManifestIndex):
+    """Record `name` in the transition model and pre-start its likely successor.
+
+    The spawns run in the background while the current call proceeds. They are
+    capped by SPECULATE_BUDGET live speculative servers and evicted after
+    SPECULATE_TTL seconds if nothing uses them.
+    """
+    transitions.observe(name)
+    if SPECULATE_BUDGET <= 0:
+        return
+    for next_name in transitions.predict(name, SPECULATE_THRESHOLD):
+        if pool.speculative_count() >= SPECULATE_BUDGET:
+            return
+        route = index.routes.get(next_name)
+        if not route or not route.server.get("command"):
+            continue
+        tool_def = route.server
+        try:
+            cmd_hash, server_params = resolve_launch(tool_def)
+        except Exception as e:
+            sys.stderr.write(f"Error resolving '{next_name}' for speculative start: {e}\n")
+            continue
+        if not pool.is_live(cmd_hash):
+            pool.warm_in_background(cmd_hash, server_params, pool.policy_for(tool_def), speculative_ttl=SPECULATE_TTL)
+
+def seed_usage_stats():
+    """Continue usage_stats from its last snapshot and fill its windows from the log."""
+    usage_stats.load()
+    usage_stats.seed(iter_entries(LOG_FILE, usage_stats.history_start()))
+
+async def prewarm_from_history():
+    """Start the downstreams of the most used tools before anyone calls them.
+
+    Also seeds usage_stats and the transition model used by speculate_next().
+    Runs in the background once the stdio server is up; servers are started
+    one at a time so pre-warming never competes with real calls for CPU.
+    """
+    try:
+        await asyncio.to_thread(seed_usage_stats)
+    except Exception as e:
+        sys.stderr.write(f"Error reading usage history for stats: {e}\n")
+
+    try:
+        # Replay history into a fresh model off the loop, then fold its counts
+        # into the live one; calls observed meanwhile keep their sequence
+        history = warmup.TransitionModel(transitions.session_gap)
+        await asyncio.to_thread(history.load, LOG_FILE, PREWARM_LOOKBACK, internal=INTERNAL_TOOLS)
+        transitions.merge(history)
+    except Exception as e:
+        sys.stderr.write(f"Error reading usage history for speculation: {e}\n")
+
+    if PREWARM_TOP_K <= 0:
+        return
+    try:
+        ranked = await asyncio.to_thread(
+            warmup.rank_tools, LOG_FILE, PREWARM_LOOKBACK, by=PREWARM_RANK_BY, internal=INTERNAL_TOOLS
+        )
+    except Exception as e:
+        sys.stderr.write(f"Error reading usage history for pre-warm: {e}\n")
+        return
+
+    routes = manifest_index().routes
+    budget = min(PREWARM_TOP_K, MAX_LIVE_SERVERS)
+    for name in ranked:
+        if budget <= 0:
+            break
+        route = routes.get(name)
+        if not route or not route.server.get("command"):
+            continue
+        tool_def = route.server
+        policy = pool.policy_for(tool_def)
+        if policy.mode == MODE_EPHEMERAL:
+            continue
+        try:
+            cmd_hash, server_params = resolve_launch(tool_def)
+            if pool.is_live(cmd_hash):
+                # Shares a server with a tool warmed already
+                continue
+            budget -= 1
+            if await pool.warm(cmd_hash, server_params, policy):
+                sys.stderr.write(f"Pre-warmed downstream for '{name}'\n")
+        except Exception as e:
+            sys.stderr.write(f"Error pre-warming '{name}': {e}\n")
+
+_env_builds: Dict[str, asyncio.Task] = {}
+
+def schedule_env_build(command: List[str]):
+    """Build the pinned environment for `command` in a worker thread."""
+    if not tool_envs.parse_uv_command(command):
+        return
+    key = tool_envs.env_key(command)
+    if key in _env_builds and not _env_builds[key].done():
+        return
+
+    async def _build():
+        try:
+            if await asyncio.to_thread(tool_envs.build_env, command):
+                sys.stderr.write(f"Prebuilt environment for {' '.join(command)}\n")
+                # Plans resolved before the build still go through uv
+                launch_plans.clear()
+        except Exception as e:
+            sys.stderr.write(f"Error prebuilding environment for {' '.join(command)}: {e}\n")
+
+    _env_builds[key] = asyncio.create_task(_build())
+
+def build_envs_cli(names: List[str], force: bool = False, prune: bool = False) -> int:
+    """`router.py build-envs [--force] [--prune] [tool ...]`: prebuild tool environments."""
+    servers = launch_defs(load_manifest())
+    failed = 0
+    for label, server_def in servers:
+        if names and label not in names:
+            continue
+        command = server_def.get("command", [])
+        try:
+            env_dir = tool_envs.build_env(command, force=force)
+        except Exception as e:
+            failed += 1
+            print(f"{label}: build failed: {e}")
+            continue
+        print(f"{label}: {env_dir or 'not a uv command, skipped'}")
+    if prune:
+        for key in tool_envs.prune_envs([s.get("command", []) for _, s in servers]):
+            print(f"removed stale environment {key}")
+    return 1 if failed else 0
+
+async def refresh_schemas_cli(names: List[str]) -> int:
+    """`router.py refresh-schemas [server or tool ...]`: start each server and re-read its tools."""
+    failed = 0
+    seen = set()
+    try:
+        for label, server_def in launch_defs(load_manifest()):
+            if names and label not in names:
+                continue
+            key = schema_key(server_def)
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                cmd_hash, server_params = resolve_launch(server_def)
+                async with pool.lease(cmd_hash, server_params, pool.policy_for(server_def)) as active:
+                    tools = await list_downstream_tools(active.session)
+                schema_cache.store(key, server_def.get("command", []), tools)
+                print(f"{label}: {len(tools)} tools")
+            except Exception as e:
+                failed += 1
+                print(f"{label}: discovery failed: {e}")
+    finally:
+        await pool.close_all()
+    return 1 if failed else 0
+
+def render_metrics() -> str:
+    """The router's counters, gauges and latency histograms in Prometheus text format."""
+    out = Exposition()
+    for tool, (calls, errors) in list(call_counters.tools.items()):
+        out.sample("mcp_router_tool_calls_total", "counter", "Routed tool calls.", calls, {"tool": tool})
+        out.sample("mcp_router_tool_errors_total", "counter", "Routed tool calls that failed.", errors, {"tool": tool})
+    out.sample("mcp_router_downstream_spawns_total", "counter", "Downstream processes started.", pool.lifecycle["spawned"])
+    out.sample("mcp_router_downstream_spawn_failures_total", "counter", "Downstream starts that failed.", pool.lifecycle["spawn_failed"])
+    out.sample("mcp_router_downstream_stops_total", "counter", "Downstream processes stopped.", pool.lifecycle["stopped"])
+    out.sample("mcp_router_speculative_spawns_total", "counter", "Speculative downstream starts.", pool.speculation["spawned"])
+    out.sample("mcp_router_speculative_hits_total", "counter", "Speculative starts that were used.", pool.speculation["hits"])
+    out.sample("mcp_router_live_downstreams", "gauge", "Downstream processes currently in the pool.", len(pool.servers))
+
+    labels = {}
+    try:
+        for label, server_def in launch_defs(load_manifest()):
+            labels.setdefault(resolve_launch(server_def)[0], label)
+    except Exception:
+        pass
+    for cmd_hash, limiter in pool.limiters().items():
+        server_label = {"server": labels.get(cmd_hash, cmd_hash[:12])}
+        out.sample("mcp_router_queue_depth", "gauge", "Calls waiting for a downstream slot.", limiter.depth, server_label)
+        out.sample("mcp_router_running_calls", "gauge", "Calls in progress on a downstream.", limiter.running, server_label)
+        out.sample("mcp_router_rejected_calls_total", "counter", "Calls rejected because the queue was full.", limiter.rejected, server_label)
+
+    for tool, phase, hist in phase_stats.items():
+        out.histogram("mcp_router_phase_seconds", "Latency of each phase of a routed call.", hist, {"tool": tool, "phase": phase})
+
+    for outcome in ("hits", "disk_hits", "misses"):
+        out.sample(f"mcp_router_result_cache_{outcome}_total", "counter", f"Result cache {outcome.replace('_', ' ')}.", result_cache.stats[outcome])
+
+    log = usage_log.stats()
+    out.sample("mcp_router_log_queue", "gauge", "Usage log lines waiting to be written.", log["queued"])
+    out.sample("mcp_router_log_written_total", "counter", "Usage log lines written.", log["written"])
+    out.sample("mcp_router_log_dropped_total", "counter", "Usage log lines dropped.", log["dropped"])
+    return out.text()
+
+async def start_metrics_server() -> Optional[MetricsServer]:
+    """Serve render_metrics() if MCP_ROUTER_METRICS_PORT or _SOCKET is set."""
+    if not METRICS_PORT and not METRICS_SOCKET:
+        return None
+    metrics_server = MetricsServer(render_metrics, METRICS_HOST, METRICS_PORT, METRICS_SOCKET or None)
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        sys.stderr.write(f"Error starting metrics endpoint: {e}\n")
+        return None
+    sys.stderr.write(f"Metrics endpoint at {metrics_server.address}\n")
+    return metrics_server
+
 async def main():
-    async with stdio_server() as (read, write):
-        await server.run(read, write, server.create_initialization_options())
+    try:
+        async with stdio_server() as (read, write):
+            prewarm = asyncio.create_task(prewarm_from_history())
+            metrics_server = await start_metrics_server()
+            try:
+                await server.run(read, write, server.create_initialization_options(
+                    NotificationOptions(tools_changed=True)
+                ))
+            finally:
+                prewarm.cancel()
+                if metrics_server is not None:
+                    await metrics_server.close()
+    finally:
+        spec = pool.speculation
+        if spec["spawned"]:
+            sys.stderr.write(
+                f"Speculative starts: {spec['spawned']} spawned, {spec['hits']} hits, {spec['misses']} misses\n"
+            )
+        for tool, phases in phase_stats.summary().items():
+            parts = ", ".join(
+                f"{phase} p50={s['p50'] * 1000:.1f}ms p99={s['p99'] * 1000:.1f}ms"
+                for phase, s in phases.items()
+            )
+            sys.stderr.write(f"Latency {tool}: {parts}\n")
+        await usage_log.close()
+        await usage_stats.close()
+        await tracer.close()
+        if usage_log.dropped:
+            sys.stderr.write(f"Usage log: {usage_log.dropped} entries dropped (disk too slow)\n")
+        await pool.close_all()
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["build-envs"]:
+        cli_args = sys.argv[2:]
+        sys.exit(build_envs_cli(
+            [a for a in cli_args if not a.startswith("--")],
+            force="--force" in cli_args,
+            prune="--prune" in cli_args,
+        ))
+    if sys.argv[1:2] == ["refresh-schemas"]:
+        sys.exit(asyncio.run(refresh_schemas_cli(sys.argv[2:])))
     asyncio.run(main())
@@ -0,0 +1,87 @@
+import sys
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Separator between server and tool in namespaced names ("github.create_issue")
+NAMESPACE_SEP = "."
+
+
+@dataclass(frozen=True)
+class Route:
+    """Where a tool exposed by the router is served from."""
+
+    # Name clients call
+    name: str
+    # Launch definition of the server (command, env, pool settings). Every
+    # route of one server shares this dict, and with it one pooled session.
+    server: Dict
+    # Downstream tool name; None means the server's tool for `name` as
+    # discovered (the same name, or the only tool of a single-tool server)
+    tool: Optional[str]
+    # Manifest entry or discovered tool providing description and inputSchema
+    definition: Dict
+    # Key of `server` in the manifest's "servers"; None for an entry with its own command
+    server_name: Optional[str] = None
+
+
+def exposed_name(server_name: str, server_def: Dict, tool: str) -> str:
+    """`server.tool` for servers with "namespace": true, else the tool's own name."""
+    if server_def.get("namespace"):
+        return f"{server_name}{NAMESPACE_SEP}{tool}"
+    return tool
+
+
+def build_routes(manifest: Dict, discovered: Callable[[Dict], List[Dict]]) -> Dict[str, Route]:
+    """Routing table for a manifest: exposed tool name -> Route.
+
+    Tool entries either carry their own "command" (one server per entry, as
+    before) or name one of the manifest's "servers" and pick its tools:
+
+        {"server": "github", "tool": "create_issue"}      one downstream tool
+        {"server": "github", "prefix": "issue_"}          every discovered tool
+                                                          starting with issue_
+
+    `discovered(server_def)` returns the tools learned from a server, which
+    prefix entries need; until the server has run they expose nothing. The
+    first entry claiming a name wins.
+    """
+    servers = manifest.get("servers", {})
+    routes: Dict[str, Route] = {}
+
+    def add(route: Route):
+        if route.name in routes:
+            sys.stderr.write(f"Duplicate tool name '{route.name}' in manifest; keeping the first\n")
+            return
+        routes[route.name] = route
+
+    for entry in manifest.get("tools", []):
+        server_name = entry.get("server")
+        if server_name is None:
+            add(Route(entry["name"], entry, None, entry))
+            continue
+        server_def = servers.get(server_name)
+        if server_def is None:
+            sys.stderr.write(f"Tool entry refers to unknown server '{server_name}'\n")
+            continue
+        if "prefix" in entry:
+            for tool in discovered(server_def):
+                if tool["name"].startswith(entry["prefix"]):
+                    add(Route(exposed_name(server_name, server_def, tool["name"]), server_def, tool["name"], tool, server_name))
+            continue
+        tool_name = entry.get("tool") or entry.get("name")
+        if not tool_name:
+            sys.stderr.write(f"Tool entry for server '{server_name}' has neither name, tool nor prefix\n")
+            continue
+        name = entry.get("name") or exposed_name(server_name, server_def, tool_name)
+        add(Route(name, server_def, tool_name, entry, server_name))
+    return routes
+
+
+def launch_defs(manifest: Dict) -> List[Tuple[str, Dict]]:
+    """(label, server definition) of every server the manifest can start.
+
+    Named servers first, then tool entries with their own command.
+    """
+    defs = [(name, server_def) for name, server_def in manifest.get("servers", {}).items()]
+    defs += [(entry["name"], entry) for entry in manifest.get("tools", []) if entry.get("command")]
+    return defs
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Discovered downstream tool lists, one file per server command
+SCHEMA_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")), "schema_cache")
+
+
+def schema_key(tool_def: Dict) -> str:
+    """Identity of a manifest entry's server: its command and configured env.
+
+    Unlike the pool's command hash this ignores the router's own
+    environment, so the key is stable across router restarts.
+    """
+    data = json.dumps({"cmd": tool_def.get("command", []), "env": tool_def.get("env", {})}, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+class SchemaCache:
+    """Tool names and input schemas reported by downstream servers.
+
+    Filled from `session.list_tools()` the first time a server is spawned and
+    kept on disk, so later router runs can list the real schemas without
+    starting anything. Entries older than `ttl` seconds are still served but
+    are re-discovered the next time the server runs.
+    """
+
+    def __init__(self, directory: str = SCHEMA_DIR, ttl: float = 7 * 24 * 3600):
+        self.directory = directory
+        self.ttl = ttl
+        # key -> cached entry, or None if there is no file
+        self._entries: Dict[str, Optional[Dict]] = {}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        if key not in self._entries:
+            entry = None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                sys.stderr.write(f"Ignoring unreadable schema cache {key}: {e}\n")
+            self._entries[key] = entry
+        return self._entries[key]
+
+    def tools(self, key: str) -> List[Dict]:
+        entry = self.get(key)
+        return entry["tools"] if entry else []
+
+    def needs_discovery(self, key: str, now: Optional[float] = None) -> bool:
+        entry = self.get(key)
+        now = time.time() if now is None else now
+        return entry is None or now - entry.get("discovered_at", 0) > self.ttl
+
+    def store(self, key: str, command: List[str], tools: List[Dict]):
+        entry = {"command": command, "discovered_at": time.time(), "tools": tools}
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp_path, self._path(key))
+        self._entries[key] = entry
+
+    def invalidate(self, key: str):
+        """Forget `key` so the next spawn of its server discovers it again."""
+        self._entries.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def downstream_tool(self, key: str, name: str) -> Optional[Dict]:
+        """The discovered tool a manifest entry called `name` stands for.
+
+        That is the tool of the same name, or the only tool of a single-tool
+        server (manifest names are often just labels for it).
+        """
+        tools = self.tools(key)
+        match = next((t for t in tools if t["name"] == name), None)
+        if match is None and len(tools) == 1:
+            match = tools[0]
+        return match
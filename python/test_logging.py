@@ -25,6 +25,8 @@ async def test_log():
     
     result = await router.call_tool("log_activity", args)
     print(f"Result: {result[0].text}")
+    # Entries are written in the background; wait for this one
+    await router.usage_log.flush()
     
     # Check LOG_FILE
     if os.path.exists(router.LOG_FILE):
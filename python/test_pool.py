@@ -0,0 +1,184 @@
+# /// script
+# dependencies = ["mcp", "pydantic"]
+# ///
+
+import asyncio
+import atexit
+import os
+import signal
+import sys
+import tempfile
+
+# Ensure we can import pool
+sys.path.append(os.path.dirname(__file__))
+
+from mcp.client.stdio import StdioServerParameters
+
+from pool import DownstreamPool, PoolPolicy, QueueFullError, MODE_KEEP_WARM
+
+# A small downstream: echo returns the server's pid, slow holds a call open
+FAKE_SERVER = '''
+import asyncio, os
+from mcp.server.fastmcp import FastMCP
+
+server = FastMCP("fake")
+
+@server.tool()
+def echo(text: str = "") -> str:
+    return f"{os.getpid()}:{text}"
+
+@server.tool()
+async def slow(seconds: float = 0.5) -> str:
+    await asyncio.sleep(seconds)
+    return f"{os.getpid()}:slept"
+
+server.run()
+'''
+
+_server_path = None
+
+
+def fake_server() -> StdioServerParameters:
+    global _server_path
+    if _server_path is None:
+        fd, _server_path = tempfile.mkstemp(prefix="fake_mcp_", suffix=".py")
+        with os.fdopen(fd, "w") as f:
+            f.write(FAKE_SERVER)
+        atexit.register(os.remove, _server_path)
+    return StdioServerParameters(command=sys.executable, args=[_server_path])
+
+
+def pid_of(result) -> int:
+    return int(result.content[0].text.split(":")[0])
+
+
+async def wait_for(condition, timeout: float = 10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("timed out waiting for the pool")
+        await asyncio.sleep(0.02)
+
+
+async def cold_calls_spawn_once():
+    pool = DownstreamPool()
+    try:
+        results = await asyncio.gather(*[
+            pool.call_tool("fake", fake_server(), PoolPolicy(), "echo", {"text": str(i)}) for i in range(8)
+        ])
+        assert len({pid_of(r) for r in results}) == 1
+        assert pool.lifecycle["spawned"] == 1
+    finally:
+        await pool.close_all()
+
+
+async def full_queue_is_refused():
+    pool = DownstreamPool()
+    policy = PoolPolicy(max_concurrency=1, max_queue=1)
+    try:
+        running = asyncio.create_task(pool.call_tool("fake", fake_server(), policy, "slow", {"seconds": 1.0}))
+        limiter = pool.limiter_for("fake", policy)
+        await wait_for(lambda: limiter.running == 1)
+        queued = asyncio.create_task(pool.call_tool("fake", fake_server(), policy, "echo", {}))
+        await wait_for(lambda: limiter.depth == 1)
+        try:
+            await pool.call_tool("fake", fake_server(), policy, "echo", {})
+            raise AssertionError("expected QueueFullError")
+        except QueueFullError:
+            pass
+        assert limiter.rejected == 1
+        await asyncio.gather(running, queued)
+    finally:
+        await pool.close_all()
+
+
+async def cancelled_waiter_leaks_no_slot():
+    pool = DownstreamPool()
+    policy = PoolPolicy(max_concurrency=1, max_queue=4)
+    try:
+        running = asyncio.create_task(pool.call_tool("fake", fake_server(), policy, "slow", {"seconds": 0.5}))
+        limiter = pool.limiter_for("fake", policy)
+        await wait_for(lambda: limiter.running == 1)
+        waiter = asyncio.create_task(pool.call_tool("fake", fake_server(), policy, "echo", {}))
+        await wait_for(lambda: limiter.depth == 1)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.depth == 0
+        await running
+        assert limiter.running == 0
+        # The slot is free again for the next call
+        await asyncio.wait_for(pool.call_tool("fake", fake_server(), policy, "echo", {}), 10)
+        assert limiter.running == 0
+    finally:
+        await pool.close_all()
+
+
+async def killed_process_is_evicted():
+    pool = DownstreamPool()
+    try:
+        pid = pid_of(await pool.call_tool("fake", fake_server(), PoolPolicy(), "echo", {}))
+        os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        await wait_for(lambda: "fake" not in pool.servers)
+        assert pid_of(await pool.call_tool("fake", fake_server(), PoolPolicy(), "echo", {})) != pid
+        assert pool.lifecycle["spawned"] == 2
+    finally:
+        await pool.close_all()
+
+
+async def keep_warm_survives_lru():
+    pool = DownstreamPool(max_servers=1)
+    warm = PoolPolicy(mode=MODE_KEEP_WARM)
+    try:
+        await pool.call_tool("warm", fake_server(), warm, "echo", {})
+        await pool.call_tool("first", fake_server(), PoolPolicy(), "echo", {})
+        await pool.call_tool("second", fake_server(), PoolPolicy(), "echo", {})
+        # The limit is soft around pinned servers: the default one is evicted instead
+        assert "warm" in pool.servers
+        assert "first" not in pool.servers
+        assert "second" in pool.servers
+    finally:
+        await pool.close_all()
+
+
+async def speculation_never_evicts_real_servers():
+    pool = DownstreamPool(max_servers=1)
+    try:
+        await pool.call_tool("real", fake_server(), PoolPolicy(), "echo", {})
+        assert not await pool.warm("guess", fake_server(), PoolPolicy(), speculative_ttl=60)
+        assert list(pool.servers) == ["real"]
+        assert pool.speculation["spawned"] == 0
+    finally:
+        await pool.close_all()
+
+
+def test_cold_calls_spawn_once():
+    asyncio.run(cold_calls_spawn_once())
+
+
+def test_full_queue_is_refused():
+    asyncio.run(full_queue_is_refused())
+
+
+def test_cancelled_waiter_leaks_no_slot():
+    asyncio.run(cancelled_waiter_leaks_no_slot())
+
+
+def test_killed_process_is_evicted():
+    asyncio.run(killed_process_is_evicted())
+
+
+def test_keep_warm_survives_lru():
+    asyncio.run(keep_warm_survives_lru())
+
+
+def test_speculation_never_evicts_real_servers():
+    asyncio.run(speculation_never_evicts_real_servers())
+
+
+if __name__ == "__main__":
+    for test in (test_cold_calls_spawn_once, test_full_queue_is_refused, test_cancelled_waiter_leaks_no_slot,
+                 test_killed_process_is_evicted, test_keep_warm_survives_lru,
+                 test_speculation_never_evicts_real_servers):
+        print(f"Testing {test.__name__[5:]}...")
+        test()
+    print("VERIFICATION SUCCESS: pool behaves as expected.")
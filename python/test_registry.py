@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+# Ensure we can import registry
+sys.path.append(os.path.dirname(__file__))
+
+from registry import COMPILED_SUFFIX, CommunityRegistry, CompiledEntries, RegistryIndex, _JsonEntries, compile_registry
+
+COMMUNITY_PATH = os.path.join(os.path.dirname(__file__), "community_servers.json")
+
+# Edge cases on top of the real registry: non-ASCII names, a duplicated
+# name (the first entry wins), aliases and a runnable entry
+EXTRA_TOOLS = [
+    {"name": "Zürich-Wetter", "description": "Wetterdaten für Zürich", "url": "https://example.org/zuerich"},
+    {"name": "dup-tool", "description": "first", "url": "https://example.org/a"},
+    {"name": "dup-tool", "description": "second", "url": "https://example.org/b"},
+    {"name": "aliased", "description": "has aliases", "aliases": ["other-name", "third"],
+     "command": ["uvx", "aliased-mcp"], "url": ""},
+]
+
+QUERIES = ["weather", "github issues", "postgres database", "browser automation", "zürich", "zzqqxx", ""]
+NAMES = ["dup-tool", "DUP_TOOL", "Zürich-Wetter", "aliased", "github", "no-such-server", "filesystem"]
+
+
+def _registry_copy(directory: str) -> str:
+    with open(COMMUNITY_PATH, "r", encoding="utf-8") as f:
+        tools = json.load(f).get("tools", [])
+    path = os.path.join(directory, "community_servers.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"tools": tools + EXTRA_TOOLS}, f)
+    return path
+
+
+def test_compiled_matches_json():
+    directory = tempfile.mkdtemp()
+    try:
+        path = _registry_copy(directory)
+        with open(path, "r", encoding="utf-8") as f:
+            tools = json.load(f)["tools"]
+        compiled_entries = CompiledEntries(compile_registry(path))
+        compiled, parsed = RegistryIndex(compiled_entries), RegistryIndex(_JsonEntries(tools))
+        try:
+            assert len(compiled.entries) == len(parsed.entries)
+            for i in range(len(tools)):
+                assert compiled.entries.entry(i) == tools[i]
+            for name in NAMES + [t["name"] for t in tools[::50]]:
+                assert compiled.get(name) == parsed.get(name), name
+                assert compiled.did_you_mean(name) == parsed.did_you_mean(name), name
+            assert compiled.get("dup-tool")["description"] == "first"
+            for query in QUERIES:
+                for offset in (0, 5):
+                    assert compiled.search(query, 10, offset) == parsed.search(query, 10, offset), query
+        finally:
+            compiled.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+async def recompiles_in_background():
+    directory = tempfile.mkdtemp()
+    try:
+        path = _registry_copy(directory)
+        registry = CommunityRegistry(path)
+        # No compiled copy yet: served from the JSON, compiled in a worker thread
+        assert isinstance(registry.index().entries, _JsonEntries)
+        assert registry.get("aliased") is not None
+        await registry._compiling
+        assert os.path.exists(path + COMPILED_SUFFIX)
+        reloaded = CommunityRegistry(path)
+        assert isinstance(reloaded.index().entries, CompiledEntries)
+        assert reloaded.get("aliased") == registry.get("aliased")
+        reloaded.index().close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_recompiles_in_background():
+    asyncio.run(recompiles_in_background())
+
+
+if __name__ == "__main__":
+    test_compiled_matches_json()
+    test_recompiles_in_background()
+    print("VERIFICATION SUCCESS: compiled registry matches the JSON.")
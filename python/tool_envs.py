@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Prebuilt per-tool environments, one directory per command hash
+ENVS_DIR = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")), "tool_envs")
+# Written last by a successful build; an env without it is ignored
+META_FILE = "mcp-env.json"
+
+# `uv run` / `uvx` flags we know how to reproduce in a pinned environment
+_VALUE_FLAGS = {"--python", "-p", "--with", "--from"}
+_IGNORED_FLAGS = {"--isolated", "--no-project", "-q", "--quiet"}
+
+
+def env_key(command: List[str]) -> str:
+    """Identity of a manifest command; any edit to it yields a new environment."""
+    return hashlib.sha256(json.dumps(command).encode()).hexdigest()[:16]
+
+
+def parse_uv_command(command: List[str]) -> Optional[Dict]:
+    """Extract python version, packages and entry point from a uv launch command.
+
+    Handles `uv run [--python X] --with pkg ... entry args` and
+    `uvx [--python X] [--from pkg] [--with pkg] entry args`. Returns None for
+    anything else (scripts, unknown flags), which then keeps running via uv.
+    """
+    if not command:
+        return None
+    exe = os.path.basename(command[0]).lower()
+    if exe.endswith(".exe"):
+        exe = exe[:-4]
+    if exe == "uv" and command[1:2] == ["run"]:
+        rest, is_uvx = command[2:], False
+    elif exe == "uvx":
+        rest, is_uvx = command[1:], True
+    else:
+        return None
+
+    python = None
+    packages: List[str] = []
+    has_from = False
+    i = 0
+    while i < len(rest) and rest[i].startswith("-"):
+        flag, _, inline = rest[i].partition("=")
+        if flag in _IGNORED_FLAGS:
+            i += 1
+            continue
+        if flag not in _VALUE_FLAGS:
+            return None
+        if inline:
+            value = inline
+            i += 1
+        elif i + 1 < len(rest):
+            value = rest[i + 1]
+            i += 2
+        else:
+            return None
+        if flag in ("--python", "-p"):
+            python = value
+        else:
+            has_from = has_from or flag == "--from"
+            packages.extend(p for p in value.split(",") if p)
+
+    if i >= len(rest):
+        return None
+    entry, args = rest[i], rest[i + 1:]
+    if entry.endswith(".py") or os.sep in entry or "/" in entry:
+        return None
+    if is_uvx and not has_from:
+        # `uvx pkg@1.2` installs pkg and runs its same-named entry point
+        packages.append(entry)
+        entry = entry.split("@")[0].split("==")[0]
+    if not packages:
+        return None
+    return {"python": python, "packages": packages, "entry": entry, "args": args}
+
+
+def _env_dir(command: List[str]) -> str:
+    return os.path.join(ENVS_DIR, env_key(command))
+
+
+def _bin(env_dir: str, name: str) -> str:
+    if sys.platform == "win32":
+        return os.path.join(env_dir, "Scripts", name + ".exe")
+    return os.path.join(env_dir, "bin", name)
+
+
+def resolve_prebuilt(command: List[str]) -> Optional[List[str]]:
+    """argv that execs the tool's prebuilt entry point directly, if it was built."""
+    env_dir = _env_dir(command)
+    meta_path = os.path.join(env_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("command") != command or not os.path.exists(meta.get("entry_path", "")):
+        return None
+    return [meta["entry_path"]] + meta.get("args", [])
+
+
+def build_env(command: List[str], uv: Optional[str] = None, force: bool = False) -> Optional[str]:
+    """Create and pin the environment for `command`. Returns its directory.
+
+    Returns None when the command is not a uv command we can prebuild; raises
+    on build failure. A failed or interrupted build never leaves the metadata
+    file behind, so the router just keeps using the original command.
+    """
+    spec = parse_uv_command(command)
+    if spec is None:
+        return None
+    env_dir = _env_dir(command)
+    if not force and resolve_prebuilt(command):
+        return env_dir
+
+    uv = uv or shutil.which("uv")
+    if not uv:
+        raise RuntimeError("uv not found on PATH")
+    if os.path.exists(env_dir):
+        shutil.rmtree(env_dir)
+    os.makedirs(ENVS_DIR, exist_ok=True)
+
+    venv_cmd = [uv, "venv", "--quiet", env_dir]
+    if spec["python"]:
+        venv_cmd += ["--python", spec["python"]]
+    subprocess.run(venv_cmd, check=True, capture_output=True, text=True)
+    subprocess.run(
+        [uv, "pip", "install", "--quiet", "--python", _bin(env_dir, "python")] + spec["packages"],
+        check=True, capture_output=True, text=True,
+    )
+
+    entry_path = _bin(env_dir, spec["entry"])
+    if not os.path.exists(entry_path):
+        shutil.rmtree(env_dir, ignore_errors=True)
+        raise RuntimeError(f"entry point '{spec['entry']}' not installed by {spec['packages']}")
+
+    meta = {
+        "command": command,
+        "entry_path": entry_path,
+        "args": spec["args"],
+        "packages": spec["packages"],
+        "built_at": time.time(),
+    }
+    tmp_path = os.path.join(env_dir, META_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(env_dir, META_FILE))
+    return env_dir
+
+
+def prune_envs(commands: List[List[str]]) -> List[str]:
+    """Delete environments no longer referenced by any of `commands`."""
+    if not os.path.isdir(ENVS_DIR):
+        return []
+    keep = {env_key(c) for c in commands}
+    removed = []
+    for name in os.listdir(ENVS_DIR):
+        if name not in keep:
+            shutil.rmtree(os.path.join(ENVS_DIR, name), ignore_errors=True)
+            removed.append(name)
+    return removed
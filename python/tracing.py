@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from metrics import PHASES
+
+# Child spans of a routed call, in the order they happen; "call" is the
+# downstream request itself
+SPAN_PHASES = tuple(p for p in PHASES if p != "serialize")
+
+
+def _hex_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header value."""
+    if not value or not isinstance(value, str):
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Span:
+    """The root span of one routed call; its children are derived from the
+    call's phase timings when it ends."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "call_span_id", "attributes")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str]):
+        self.trace_id = trace_id
+        self.span_id = _hex_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        # Chosen up front so the downstream request can name it as parent
+        self.call_span_id = _hex_id(8)
+        self.attributes: Dict[str, object] = {}
+
+    def downstream_meta(self) -> Dict[str, str]:
+        """`_meta` for the downstream request: W3C trace context with the
+        downstream call span as parent."""
+        return {"traceparent": f"00-{self.trace_id}-{self.call_span_id}-01"}
+
+
+def _attributes(values: Dict[str, object]) -> List[Dict]:
+    out = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            out.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            out.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            out.append({"key": key, "value": {"doubleValue": value}})
+        elif value is not None:
+            out.append({"key": key, "value": {"stringValue": str(value)}})
+    return out
+
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+
+def _otlp_span(trace_id: str, span_id: str, parent_id: Optional[str], name: str, kind: int, start_ns: int,
+               end_ns: int, attributes: Dict[str, object], error: Optional[str] = None) -> Dict:
+    span = {
+        "traceId": trace_id,
+        "spanId": span_id,
+        "name": name,
+        "kind": kind,
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(end_ns),
+        "attributes": _attributes(attributes),
+        "status": {"code": 2, "message": error} if error else {"code": 1},
+    }
+    if parent_id:
+        span["parentSpanId"] = parent_id
+    return span
+
+
+class Tracer:
+    """Samples routed calls into spans and exports them in batches.
+
+    A call is traced if the client's request carries a sampled W3C
+    `traceparent` in its `_meta`, or otherwise with probability
+    `sample_rate`; 0 turns tracing off, so an idle router pays one
+    comparison per call. Finished spans are buffered and written
+    `flush_interval` seconds later (or once `batch_size` are waiting), one
+    OTLP/JSON `resourceSpans` document per line of `path`, and also POSTed
+    to `endpoint` (an OTLP/HTTP collector's /v1/traces) if one is set.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 0.0, endpoint: str = "", batch_size: int = 256,
+                 flush_interval: float = 2.0, service_name: str = "mcp-manager-router"):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.service_name = service_name
+        self._pending: List[Dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # Exports of full batches still running
+        self._exports: set = set()
+        self.exported = 0
+        self.failed = 0
+
+    def start(self, name: str, traceparent: Optional[str] = None) -> Optional[Span]:
+        """A root span for a call, or None if it is not sampled."""
+        if self.sample_rate <= 0:
+            return None
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            if not sampled:
+                return None
+            return Span(name, trace_id, parent_id)
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        return Span(name, _hex_id(16), None)
+
+    def finish(self, span: Span, phases: Dict[str, float], error: Optional[str] = None):
+        """End `span` now and queue it with one child per timed phase.
+
+        Phases run back to back, so children are laid out in order from the
+        root's start using their measured durations.
+        """
+        end_ns = time.time_ns()
+        spans = [_otlp_span(span.trace_id, span.span_id, span.parent_id, span.name, KIND_SERVER,
+                            span.start_ns, end_ns, span.attributes, error)]
+        cursor = span.start_ns
+        for phase in SPAN_PHASES:
+            seconds = phases.get(phase)
+            if seconds is None:
+                continue
+            child_end = min(end_ns, cursor + int(seconds * 1e9))
+            if phase == "call":
+                spans.append(_otlp_span(span.trace_id, span.call_span_id, span.span_id, phase, KIND_CLIENT,
+                                        cursor, child_end, {}, error))
+            else:
+                spans.append(_otlp_span(span.trace_id, _hex_id(8), span.span_id, phase, KIND_INTERNAL,
+                                        cursor, child_end, {}))
+            cursor = child_end
+        self._pending.extend(spans)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._export(self._take())
+            return
+        if len(self._pending) >= self.batch_size:
+            task = loop.create_task(asyncio.to_thread(self._export, self._take()))
+            self._exports.add(task)
+            task.add_done_callback(self._exports.discard)
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        batch = self._take()
+        if batch:
+            await asyncio.to_thread(self._export, batch)
+
+    def _take(self) -> List[Dict]:
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _export(self, spans: List[Dict]):
+        if not spans:
+            return
+        document = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": _attributes({"service.name": self.service_name})},
+                "scopeSpans": [{"scope": {"name": "mcp-router"}, "spans": spans}],
+            }]
+        }, separators=(",", ":"))
+        try:
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(document + "\n")
+            if self.endpoint:
+                request = urllib.request.Request(
+                    self.endpoint, data=document.encode("utf-8"),
+                    headers={"Content-Type": "application/json"}, method="POST",
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+            self.exported += len(spans)
+        except Exception as e:
+            self.failed += len(spans)
+            sys.stderr.write(f"Error exporting {len(spans)} trace spans: {e}\n")
+
+    async def close(self):
+        """Export whatever is still buffered."""
+        task, self._flush_task = self._flush_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._exports:
+            await asyncio.gather(*list(self._exports), return_exceptions=True)
+        batch = self._take()
+        if batch:
+            await asyncio.to_thread(self._export, batch)
@@ -0,0 +1,67 @@
+import heapq
+import re
+from typing import Dict, Iterable, List, Set, Tuple
+
+_SPLIT = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse separators, so "Brave-Search" == "brave_search"."""
+    return " ".join(w for w in _SPLIT.split(text.lower()) if w)
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of each word, padded like pg_trgm ("  p", " po", ...)."""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Fuzzy lookup of names by trigram similarity.
+
+    Each target (e.g. a registry entry name) may be indexed under several
+    spellings (its name, aliases). Similarity is the Jaccard index of the
+    trigram sets, so a dropped or doubled letter in a long name still scores
+    well, while short strings need to be nearly exact.
+    """
+
+    def __init__(self):
+        # trigram -> ids of the spellings containing it
+        self.postings: Dict[str, List[int]] = {}
+        # (target, number of trigrams) per spelling
+        self.spellings: List[Tuple[str, int]] = []
+        self._seen: Set[Tuple[str, str]] = set()
+
+    def add(self, target: str, spellings: Iterable[str]):
+        for text in spellings:
+            key = (target, normalize(text))
+            if not key[1] or key in self._seen:
+                continue
+            self._seen.add(key)
+            grams = trigrams(text)
+            sid = len(self.spellings)
+            self.spellings.append((target, len(grams)))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(sid)
+
+    def similar(self, query: str, limit: int = 5, threshold: float = 0.3) -> List[Tuple[str, float]]:
+        """Up to `limit` (target, similarity) pairs scoring at least `threshold`, best first."""
+        grams = trigrams(query)
+        if not grams:
+            return []
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for sid in self.postings.get(gram, ()):
+                shared[sid] = shared.get(sid, 0) + 1
+
+        best: Dict[str, float] = {}
+        for sid, n in shared.items():
+            target, size = self.spellings[sid]
+            score = n / (len(grams) + size - n)
+            if score >= threshold and score > best.get(target, 0.0):
+                best[target] = score
+        # Ties go to the shorter name: "weather" before "weather-mcp-server"
+        return heapq.nsmallest(limit, best.items(), key=lambda item: (-item[1], len(item[0]), item[0]))
@@ -0,0 +1,218 @@
+import gzip
+import json
+import os
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Sidecar of a log file: usage.jsonl.idx, usage-<first>-<last>.jsonl.gz.idx
+INDEX_SUFFIX = ".idx"
+
+
+def index_path(log_path: str) -> str:
+    return log_path + INDEX_SUFFIX
+
+
+class IndexBuilder:
+    """Groups appended lines into index records, one per block of the log.
+
+    A block holds the lines of one `bucket`-second time slice, up to
+    `max_bytes`. Its record is
+        {"t0": first, "t1": last, "offset": o, "length": n,
+         "tools": {tool: [calls, errors]}}
+    so a query can skip blocks outside its time range or without its tool
+    and seek straight to the rest.
+    """
+
+    def __init__(self, bucket: float = 60.0, max_bytes: int = 64 * 1024):
+        self.bucket = bucket
+        self.max_bytes = max_bytes
+        self._open: Optional[Dict] = None
+
+    def add(self, offset: int, length: int, ts: float, tool: Optional[str], success: bool) -> Optional[Dict]:
+        """Account for one line written at `offset`; returns a record if this closed one."""
+        closed = None
+        block = self._open
+        if block is not None and (
+            offset != block["offset"] + block["length"]
+            or int(ts // self.bucket) != int(block["t0"] // self.bucket)
+            or block["length"] + length > self.max_bytes
+        ):
+            closed = self.close()
+            block = None
+        if block is None:
+            block = self._open = {"t0": ts, "t1": ts, "offset": offset, "length": 0, "tools": {}}
+        block["t0"] = min(block["t0"], ts)
+        block["t1"] = max(block["t1"], ts)
+        block["length"] += length
+        if tool:
+            counts = block["tools"].setdefault(tool, [0, 0])
+            counts[0] += 1
+            if not success:
+                counts[1] += 1
+        return closed
+
+    def close(self) -> Optional[Dict]:
+        """Close the current block and return its record, if any."""
+        block, self._open = self._open, None
+        return block
+
+    def discard(self):
+        """Forget the current block, e.g. because its file was rotated away."""
+        self._open = None
+
+
+def append_records(path: str, records: Iterable[Dict]):
+    lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+    if lines:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def read_records(path: str) -> List[Dict]:
+    """Records of an index file, in file order; [] if there is none."""
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def index_lines(lines: Iterable[bytes], offset: int, builder: IndexBuilder) -> List[Dict]:
+    """Index records for raw log lines starting at `offset` (used to catch up
+    on parts of a log written without an index)."""
+    records = []
+    for line in lines:
+        ts, tool, success = 0.0, None, True
+        try:
+            entry = json.loads(line)
+            ts = float(entry.get("timestamp", 0))
+            tool = entry.get("tool")
+            success = bool(entry.get("success"))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        closed = builder.add(offset, len(line), ts, tool, success)
+        if closed:
+            records.append(closed)
+        offset += len(line)
+    closed = builder.close()
+    if closed:
+        records.append(closed)
+    return records
+
+
+def compress_indexed(src: str, dst: str, records: List[Dict]) -> List[Dict]:
+    """gzip `src` into `dst` one member per index record, so each block can
+    be decompressed on its own, and return the records re-pointed at the
+    compressed members. Bytes no record covers get members of their own
+    whose records have "tools": None (contents unknown; always scanned).
+
+    The result is an ordinary gzip file for any other reader.
+    """
+    size = os.path.getsize(src)
+    regions: List[Tuple[int, int, Optional[Dict]]] = []
+    pos = 0
+    for record in sorted(records, key=lambda r: r["offset"]):
+        start, end = record["offset"], record["offset"] + record["length"]
+        if start < pos or end > size:
+            # Overlapping or past the end: not from this file, ignore
+            continue
+        if start > pos:
+            regions.append((pos, start, None))
+        regions.append((start, end, record))
+        pos = end
+    if pos < size:
+        regions.append((pos, size, None))
+
+    out_records = []
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        for start, end, record in regions:
+            fin.seek(start)
+            member = gzip.compress(fin.read(end - start))
+            out = dict(record) if record else {"t0": None, "t1": None, "tools": None}
+            out["offset"] = fout.tell()
+            out["length"] = len(member)
+            fout.write(member)
+            out_records.append(out)
+    return out_records
+
+
+def read_block(path: str, record: Dict) -> List[bytes]:
+    """The log lines of one indexed block."""
+    with open(path, "rb") as f:
+        f.seek(record["offset"])
+        data = f.read(record["length"])
+    if path.endswith(".gz"):
+        data = gzip.decompress(data)
+    return data.splitlines()
+
+
+def may_match(record: Dict, since: float, until: Optional[float], tool: Optional[str],
+              success: Optional[bool]) -> bool:
+    """Whether a block can hold entries matching a query."""
+    if record.get("tools") is None:
+        return True
+    if record["t1"] < since or (until is not None and record["t0"] > until):
+        return False
+    if tool is not None:
+        counts = record["tools"].get(tool)
+        if not counts:
+            return False
+        candidates = [counts]
+    else:
+        candidates = list(record["tools"].values())
+    if success is True:
+        return any(calls > errors for calls, errors in candidates)
+    if success is False:
+        return any(errors for _, errors in candidates)
+    return True
+
+
+def entry_matches(entry: Dict, since: float, until: Optional[float], tool: Optional[str],
+                  success: Optional[bool]) -> bool:
+    ts = entry.get("timestamp", 0)
+    if ts < since or (until is not None and ts > until):
+        return False
+    if tool is not None and entry.get("tool") != tool:
+        return False
+    return success is None or bool(entry.get("success")) == success
+
+
+def iter_file_newest_first(path: str, since: float, until: Optional[float], tool: Optional[str],
+                           success: Optional[bool]) -> Iterator[Dict]:
+    """Matching entries of one log file, newest first, via its sidecar index.
+
+    Only blocks that may match are read. The part of a plain log past its
+    last indexed block (written since, or by a router without an index) is
+    scanned directly; a file with no index at all is scanned whole.
+    """
+    records = read_records(index_path(path))
+    regions: List[Dict] = [r for r in records if may_match(r, since, until, tool, success)]
+    if not path.endswith(".gz"):
+        indexed_end = max((r["offset"] + r["length"] for r in records), default=0)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size > indexed_end:
+            regions.append({"offset": indexed_end, "length": size - indexed_end, "tools": None})
+    elif not records:
+        regions.append({"offset": 0, "length": os.path.getsize(path), "tools": None})
+
+    for record in sorted(regions, key=lambda r: r["offset"], reverse=True):
+        try:
+            lines = read_block(path, record)
+        except (OSError, EOFError, zlib.error):
+            continue
+        for line in reversed(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry_matches(entry, since, until, tool, success):
+                yield entry
@@ -0,0 +1,404 @@
+import asyncio
+import calendar
+import glob
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from usage_index import (
+    IndexBuilder, append_records, compress_indexed, index_lines, index_path,
+    iter_file_newest_first, read_records,
+)
+
+# Closed segments: usage-<first entry>-<last entry>[-<n>].jsonl.gz next to the
+# active log; n tells apart segments closed within the same second
+_SEGMENT = re.compile(r"-(\d{8}T\d{6})-(\d{8}T\d{6})(?:-(\d+))?\.jsonl(\.gz)?$")
+_STAMP = "%Y%m%dT%H%M%S"
+
+
+def _stamp(ts: float) -> str:
+    return time.strftime(_STAMP, time.gmtime(ts))
+
+
+def _parse_stamp(text: str) -> float:
+    return float(calendar.timegm(time.strptime(text, _STAMP)))
+
+
+def segment_range(path: str) -> Optional[Tuple[float, float]]:
+    """(first, last) entry time encoded in a closed segment's file name."""
+    match = _SEGMENT.search(os.path.basename(path))
+    if not match:
+        return None
+    return _parse_stamp(match.group(1)), _parse_stamp(match.group(2))
+
+
+def _segment_order(path: str) -> Tuple[float, float, int]:
+    match = _SEGMENT.search(os.path.basename(path))
+    return _parse_stamp(match.group(1)), _parse_stamp(match.group(2)), int(match.group(3) or 0)
+
+
+def segment_paths(log_path: str, since: float = 0.0, until: Optional[float] = None) -> List[str]:
+    """Closed segments of `log_path` that may hold entries in [since, until], oldest first.
+
+    Stamps are truncated to whole seconds, hence the one-second slack.
+    """
+    base, _ = os.path.splitext(log_path)
+    paths = []
+    for path in glob.glob(glob.escape(base) + "-*.jsonl*"):
+        span = segment_range(path)
+        if span is None or span[1] + 1 < since or (until is not None and span[0] > until):
+            continue
+        paths.append(path)
+    return sorted(paths, key=_segment_order)
+
+
+def open_segment(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_entries(log_path: str, since: float = 0.0, until: Optional[float] = None) -> Iterable[Dict]:
+    """Usage entries from closed segments and the active log, oldest first.
+
+    Skips segments outside [since, until] without opening them and lines
+    that do not parse.
+    """
+    paths = segment_paths(log_path, since, until)
+    if os.path.exists(log_path):
+        paths.append(log_path)
+    for path in paths:
+        try:
+            f = open_segment(path)
+        except OSError:
+            # Rotated or pruned since it was listed
+            continue
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                ts = entry.get("timestamp", 0)
+                if ts >= since and (until is None or ts <= until):
+                    yield entry
+
+
+def query_entries(log_path: str, since: float = 0.0, until: Optional[float] = None, tool: Optional[str] = None,
+                  success: Optional[bool] = None, limit: int = 50) -> List[Dict]:
+    """Up to `limit` entries matching the filters, newest first.
+
+    Walks the active log, then segments from newest to oldest, reading only
+    the blocks their sidecar indexes say can match (see usage_index), and
+    stops once `limit` entries are found.
+    """
+    paths = [log_path] + segment_paths(log_path, since, until)[::-1]
+    results: List[Dict] = []
+    for path in paths:
+        try:
+            for entry in iter_file_newest_first(path, since, until, tool, success):
+                results.append(entry)
+                if len(results) >= limit:
+                    return results
+        except OSError:
+            # Rotated or pruned while we were reading it
+            continue
+    return results
+
+
+def _first_timestamp(path: str) -> Optional[float]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    return float(json.loads(line)["timestamp"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return None
+
+
+def _last_timestamp(path: str) -> Optional[float]:
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            return float(json.loads(line)["timestamp"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return None
+
+
+class UsageLogWriter:
+    """Appends usage log lines from a background task, in batches.
+
+    write() only queues the line. A task on the running event loop waits
+    for the first queued line, gives others up to `flush_interval` seconds
+    (or until `batch_size` are queued) to join it, then appends the batch in
+    a worker thread so file I/O never blocks the loop. When more than
+    `max_queue` lines are waiting (disk too slow), new lines are dropped
+    and counted. Lines still queued when the task is cancelled, e.g. as the
+    loop shuts down, are written before it exits.
+
+    Outside an event loop lines are written immediately.
+
+    The active log is rotated once it exceeds `max_bytes` or its first
+    entry is older than `max_age` seconds: it is renamed to a segment named
+    after its first and last entry times and gzipped, and segments whose
+    last entry is older than `retention` seconds are deleted. Passing 0
+    disables the respective limit.
+
+    Alongside each file a sidecar index (usage_index) records, per block of
+    lines, their byte range, time span and tools, so query_entries() reads
+    only the blocks it needs. Blocks cover `index_bucket` seconds; each
+    becomes its own gzip member when the file is compressed.
+    """
+
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 0.2, max_queue: int = 10000,
+                 max_bytes: int = 0, max_age: float = 0.0, retention: float = 0.0, index_bucket: float = 60.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention = retention
+        # First entry time of the active log, read back lazily
+        self._started: Optional[float] = None
+        self._size = 0
+        self._recovered = False
+        self.rotations = 0
+        self._index = IndexBuilder(index_bucket)
+        # (line, its log entry if the caller had it at hand)
+        self._queue: Deque[Tuple[str, Optional[Dict]]] = deque()
+        self._io_lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def write(self, line: str, entry: Optional[Dict] = None):
+        """Queue one line (including its trailing newline) for appending.
+
+        Passing the entry `line` encodes saves parsing it again for the index.
+        """
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append((line, entry))
+        if not self._ensure_task():
+            self._drain()
+            return
+        if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_task(self) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        return True
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                if len(self._queue) < self.batch_size:
+                    # Let a burst accumulate into one write
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+                await asyncio.to_thread(self._drain)
+        except asyncio.CancelledError:
+            self._drain()
+            raise
+
+    def _drain(self):
+        with self._io_lock:
+            if not self._recovered:
+                self._recovered = True
+                self._recover()
+            items = []
+            while self._queue:
+                items.append(self._queue.popleft())
+            if not items:
+                return
+            data = [line.encode("utf-8") for line, _ in items]
+            try:
+                with open(self.path, "ab") as f:
+                    f.write(b"".join(data))
+                    size = f.tell()
+            except OSError as e:
+                self.dropped += len(items)
+                sys.stderr.write(f"Error writing usage log: {e}\n")
+                return
+            self.written += len(items)
+            self.batches += 1
+            offset = size - sum(len(d) for d in data)
+            if offset < self._size:
+                # Another router rotated the log under us
+                self._started = None
+                self._index.discard()
+            self._size = size
+            try:
+                self._update_index(offset, data, items)
+            except OSError as e:
+                sys.stderr.write(f"Error writing usage log index: {e}\n")
+            try:
+                if self._should_rotate(size):
+                    self._rotate()
+            except OSError as e:
+                sys.stderr.write(f"Error rotating usage log: {e}\n")
+
+    def _update_index(self, offset: int, data: List[bytes], items: List[Tuple[str, Optional[Dict]]]):
+        closed = []
+        for raw, (line, entry) in zip(data, items):
+            if entry is None:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = {}
+            record = self._index.add(offset, len(raw), entry.get("timestamp", time.time()),
+                                     entry.get("tool"), bool(entry.get("success")))
+            if record:
+                closed.append(record)
+            offset += len(raw)
+        append_records(index_path(self.path), closed)
+
+    def _close_block(self):
+        record = self._index.close()
+        if record:
+            append_records(index_path(self.path), [record])
+
+    def _should_rotate(self, size: int) -> bool:
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        if self.max_age:
+            if self._started is None:
+                self._started = _first_timestamp(self.path)
+            return self._started is not None and time.time() - self._started >= self.max_age
+        return False
+
+    def _rotate(self):
+        first = _first_timestamp(self.path)
+        last = _last_timestamp(self.path)
+        now = time.time()
+        base, _ = os.path.splitext(self.path)
+        name = f"{base}-{_stamp(first or now)}-{_stamp(last or now)}"
+        segment, n = name + ".jsonl", 0
+        while os.path.exists(segment) or os.path.exists(segment + ".gz"):
+            n += 1
+            segment = f"{name}-{n}.jsonl"
+        self._close_block()
+        # Rename first so appends go to a fresh file straight away
+        os.replace(self.path, segment)
+        if os.path.exists(index_path(self.path)):
+            os.replace(index_path(self.path), index_path(segment))
+        self._started = None
+        self._size = 0
+        self.rotations += 1
+        self._compress(segment)
+        self._prune(now)
+
+    def _compress(self, segment: str):
+        tmp_path = segment + ".gz.tmp"
+        records = read_records(index_path(segment))
+        if records:
+            records = compress_indexed(segment, tmp_path, records)
+            index_tmp = index_path(segment + ".gz") + ".tmp"
+            with open(index_tmp, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+            os.replace(index_tmp, index_path(segment + ".gz"))
+        else:
+            with open(segment, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, segment + ".gz")
+        os.remove(segment)
+        if records:
+            os.remove(index_path(segment))
+
+    def _recover(self):
+        """Pick up after a previous run: gzip segments it renamed but did not
+        compress, and index the part of the active log its index lacks."""
+        for path in segment_paths(self.path):
+            if not path.endswith(".gz"):
+                try:
+                    self._compress(path)
+                except OSError as e:
+                    sys.stderr.write(f"Error compressing usage log segment {path}: {e}\n")
+        try:
+            records = read_records(index_path(self.path))
+            indexed_end = max((r["offset"] + r["length"] for r in records), default=0)
+            with open(self.path, "rb") as f:
+                f.seek(indexed_end)
+                append_records(index_path(self.path), index_lines(f, indexed_end, IndexBuilder(self._index.bucket)))
+                self._size = f.tell()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            sys.stderr.write(f"Error indexing usage log: {e}\n")
+
+    def _prune(self, now: float):
+        if not self.retention:
+            return
+        for path in segment_paths(self.path):
+            span = segment_range(path)
+            if span and span[1] < now - self.retention:
+                for stale in (path, index_path(path)):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+
+    async def flush(self):
+        """Write everything queued so far, including a batch the background
+        task has already taken and is still writing (_drain waits for it on
+        the I/O lock)."""
+        await asyncio.to_thread(self._drain)
+
+    async def close(self):
+        """Stop the background task and write what is left."""
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._drain()
+        with self._io_lock:
+            try:
+                self._close_block()
+            except OSError as e:
+                sys.stderr.write(f"Error writing usage log index: {e}\n")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+        }
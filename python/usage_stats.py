@@ -0,0 +1,331 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Sequence
+
+from metrics import Histogram
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Each rolling window is kept as this many slots; the oldest slot is dropped
+# as a new one starts, so a window covers between (n-1)/n and all of its span
+SLOTS_PER_WINDOW = 60
+
+
+def window_label(seconds: float) -> str:
+    """300 -> "5m", 3600 -> "1h", 86400 -> "24h"."""
+    if seconds % 3600 == 0:
+        return f"{int(seconds // 3600)}h"
+    if seconds % 60 == 0:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds)}s"
+
+
+class ToolCounts:
+    """Calls, errors and latencies of one tool within one window slot."""
+
+    __slots__ = ("calls", "errors", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    def record(self, success: bool, duration: float):
+        self.calls += 1
+        if not success:
+            self.errors += 1
+        self.latency.record(duration)
+
+    def merge(self, other: "ToolCounts"):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+
+
+class _Window:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.width = seconds / SLOTS_PER_WINDOW
+        # slot number (timestamp // width) -> tool -> counts
+        self.slots: Dict[int, Dict[str, ToolCounts]] = {}
+
+    def record(self, tool: str, ts: float, success: bool, duration: float, now: float):
+        slot = int(ts // self.width)
+        if slot <= self._oldest(now):
+            return
+        tools = self.slots.get(slot)
+        if tools is None:
+            tools = self.slots[slot] = {}
+            self._prune(now)
+        counts = tools.get(tool)
+        if counts is None:
+            counts = tools[tool] = ToolCounts()
+        counts.record(success, duration)
+
+    def _oldest(self, now: float) -> int:
+        return int(now // self.width) - SLOTS_PER_WINDOW
+
+    def _prune(self, now: float):
+        oldest = self._oldest(now)
+        for slot in [s for s in self.slots if s <= oldest]:
+            del self.slots[slot]
+
+    def summary(self, now: float) -> Dict:
+        self._prune(now)
+        merged: Dict[str, ToolCounts] = {}
+        for tools in self.slots.values():
+            for tool, counts in tools.items():
+                total = merged.get(tool)
+                if total is None:
+                    total = merged[tool] = ToolCounts()
+                total.merge(counts)
+        calls = sum(c.calls for c in merged.values())
+        errors = sum(c.errors for c in merged.values())
+        return {
+            "seconds": self.seconds,
+            "calls": calls,
+            "errors": errors,
+            "tools": {
+                tool: {
+                    "calls": c.calls,
+                    "errors": c.errors,
+                    "success_rate": round((c.calls - c.errors) / c.calls, 4),
+                    "latency": c.latency.summary(),
+                }
+                for tool, c in merged.items()
+            },
+        }
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Hold an exclusive lock on `path` (created if missing) across processes."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10s; keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _add_counts(tools: Dict[str, Dict], tool: str, calls: int, errors: int, ts: float):
+    counts = tools.get(tool)
+    if counts is None:
+        counts = tools[tool] = {"calls": 0, "errors": 0, "last_called": 0}
+    counts["calls"] += calls
+    counts["errors"] += errors
+    counts["last_called"] = max(counts["last_called"], ts)
+
+
+def _merge_totals(base: Dict, delta: Dict) -> Dict:
+    """`base` + `delta`, both shaped like a snapshot's "totals"."""
+    merged = {
+        "calls": base.get("calls", 0) + delta["calls"],
+        "errors": base.get("errors", 0) + delta["errors"],
+        "tools": {},
+    }
+    for source in (base.get("tools", {}), delta["tools"]):
+        for tool, counts in source.items():
+            _add_counts(merged["tools"], tool, counts.get("calls", 0), counts.get("errors", 0),
+                        counts.get("last_called", 0))
+    return merged
+
+
+def _empty_totals() -> Dict:
+    return {"calls": 0, "errors": 0, "tools": {}}
+
+
+class UsageStats:
+    """Running totals and rolling-window aggregates of usage log entries.
+
+    Every entry the router logs is also recorded here, so dashboards and the
+    `usage_stats` tool read a small summary instead of re-parsing the log.
+    The summary is written to `path` (atomically, at most every `interval`
+    seconds while calls come in). All-time totals continue from the previous
+    snapshot; windows are filled from recent log history at startup by
+    seed().
+
+    Several routers can share one snapshot: each save() merges the calls
+    this router counted since its previous save into the totals on disk
+    under a lock file, so no router overwrites another's counts. Windows
+    are per router; the file holds those of whichever saved last.
+    """
+
+    def __init__(self, path: str, windows: Sequence[float] = (300, 3600, 86400), interval: float = 5.0):
+        self.path = path
+        self.interval = interval
+        self.windows = [_Window(seconds) for seconds in sorted(windows)]
+        self.started_at = time.time()
+        self.calls = 0
+        self.errors = 0
+        # tool -> {"calls", "errors", "last_called"}
+        self.tools: Dict[str, Dict] = {}
+        # Totals counted here and not yet merged into the file (see save())
+        self._unsaved = _empty_totals()
+        self._lock = threading.Lock()
+        self._save_task: Optional[asyncio.Task] = None
+        # Entries up to this time are already in the totals (see load())
+        self._totals_until = 0.0
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            saved["totals"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            sys.stderr.write(f"Ignoring unreadable usage stats {self.path}: {e}\n")
+            return None
+        return saved
+
+    def _set_base(self, totals: Dict):
+        """Totals become `totals` (as saved) plus what is not saved yet; holds _lock."""
+        merged = _merge_totals(totals, self._unsaved)
+        self.calls, self.errors, self.tools = merged["calls"], merged["errors"], merged["tools"]
+
+    def load(self) -> bool:
+        """Continue all-time totals from the last snapshot; False if there is none."""
+        saved = self._read()
+        if saved is None:
+            return False
+        with self._lock:
+            self._set_base(saved["totals"])
+        self._totals_until = saved.get("updated_at", 0.0)
+        return True
+
+    def history_start(self) -> float:
+        """Earliest log entry seed() has a use for."""
+        longest = self.windows[-1].seconds if self.windows else 0
+        return min(time.time() - longest, self._totals_until)
+
+    def seed(self, entries: Iterable[Dict]):
+        """Record past log entries: into the windows, and into the totals
+        if the snapshot load() continued from does not count them.
+
+        A live router saves what it counted within about `interval` seconds,
+        so only entries older than that are known to have been left unsaved
+        (by a router that stopped without saving); newer ones are left to
+        whichever router logged them.
+        """
+        now = time.time()
+        unsaved_before = self.started_at - 2 * self.interval
+        for entry in entries:
+            ts = entry.get("timestamp", 0)
+            # Entries logged since startup were recorded live already
+            if ts < self.started_at:
+                self._record(entry, now, totals=self._totals_until < ts < unsaved_before)
+
+    def _record(self, entry: Dict, now: float, totals: bool = True):
+        tool = entry.get("tool")
+        if not tool:
+            return
+        ts = entry.get("timestamp", now)
+        success = bool(entry.get("success"))
+        duration = entry.get("duration") or 0.0
+        with self._lock:
+            if totals:
+                errors = 0 if success else 1
+                self.calls += 1
+                self.errors += errors
+                _add_counts(self.tools, tool, 1, errors, ts)
+                self._unsaved["calls"] += 1
+                self._unsaved["errors"] += errors
+                _add_counts(self._unsaved["tools"], tool, 1, errors, ts)
+            for window in self.windows:
+                window.record(tool, ts, success, duration, now)
+
+    def record(self, entry: Dict):
+        """Count one log entry as it is written and schedule a snapshot."""
+        self._record(entry, time.time())
+        self._schedule_save()
+
+    def _schedule_save(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.interval)
+        await asyncio.to_thread(self.save)
+
+    def snapshot(self, tool: Optional[str] = None) -> Dict:
+        now = time.time()
+        with self._lock:
+            windows = {window_label(w.seconds): w.summary(now) for w in self.windows}
+            tools = {t: dict(c) for t, c in self.tools.items()}
+            calls, errors = self.calls, self.errors
+        if tool is not None:
+            tools = {t: c for t, c in tools.items() if t == tool}
+            for window in windows.values():
+                window["tools"] = {t: c for t, c in window["tools"].items() if t == tool}
+                window["calls"] = sum(c["calls"] for c in window["tools"].values())
+                window["errors"] = sum(c["errors"] for c in window["tools"].values())
+        return {
+            "updated_at": now,
+            "started_at": self.started_at,
+            "totals": {"calls": calls, "errors": errors, "tools": tools},
+            "windows": windows,
+        }
+
+    def save(self):
+        """Merge the totals counted since the last save into the snapshot at
+        `path` and write it back via a temp file and rename, under a lock."""
+        with self._lock:
+            delta, self._unsaved = self._unsaved, _empty_totals()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with _file_lock(self.path + ".lock"):
+                saved = self._read()
+                totals = _merge_totals(saved["totals"] if saved else _empty_totals(), delta)
+                snapshot = self.snapshot()
+                snapshot["totals"] = totals
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            sys.stderr.write(f"Error writing usage stats: {e}\n")
+            with self._lock:
+                # Try again with the next save
+                self._unsaved = _merge_totals(self._unsaved, delta)
+            return
+        with self._lock:
+            # Pick up what other routers merged meanwhile
+            self._set_base(totals)
+
+    async def close(self):
+        """Cancel a pending snapshot and write a final one."""
+        task, self._save_task = self._save_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.save()
@@ -0,0 +1,101 @@
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+import usage_log
+
+# How history is turned into a ranking
+RANK_BY_FREQUENCY = "frequency"  # most calls within the lookback window first
+RANK_BY_RECENCY = "recency"      # most recently called first
+
+
+def iter_usage(log_path: str, since: float = 0.0) -> Iterable[Dict]:
+    """Yield usage log entries newer than `since`, skipping unreadable lines.
+
+    Rotated segments covering the window are read before the active log.
+    """
+    return usage_log.iter_entries(log_path, since)
+
+
+def is_downstream_call(tool: Optional[str], internal: Iterable[str] = ()) -> bool:
+    """True for log entries that were routed to a downstream server."""
+    return bool(tool) and not tool.startswith("native:") and tool not in internal
+
+
+def rank_tools(log_path: str, lookback: float, by: str = RANK_BY_FREQUENCY,
+               internal: Iterable[str] = (), now: Optional[float] = None) -> List[str]:
+    """Rank downstream tools by their use in the last `lookback` seconds."""
+    now = time.time() if now is None else now
+    internal = set(internal)
+    counts: Dict[str, int] = {}
+    last_seen: Dict[str, float] = {}
+
+    for entry in iter_usage(log_path, since=now - lookback):
+        tool = entry.get("tool")
+        if not is_downstream_call(tool, internal):
+            continue
+        counts[tool] = counts.get(tool, 0) + 1
+        last_seen[tool] = max(last_seen.get(tool, 0.0), entry.get("timestamp", 0.0))
+
+    if by == RANK_BY_RECENCY:
+        key = lambda t: (last_seen[t], counts[t])
+    else:
+        if by != RANK_BY_FREQUENCY:
+            sys.stderr.write(f"Unknown pre-warm ranking '{by}', using '{RANK_BY_FREQUENCY}'\n")
+        key = lambda t: (counts[t], last_seen[t])
+    return sorted(counts, key=key, reverse=True)
+
+
+class TransitionModel:
+    """First-order model of which tool tends to be called after which.
+
+    Two downstream calls count as a transition when the second starts within
+    `session_gap` seconds of the first; longer pauses start a new sequence.
+    """
+
+    def __init__(self, session_gap: float = 300.0):
+        self.session_gap = session_gap
+        # counts[a][b] = how often b followed a
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.totals: Dict[str, int] = {}
+        self._last_tool: Optional[str] = None
+        self._last_time = 0.0
+
+    def observe(self, tool: str, timestamp: Optional[float] = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        prev = self._last_tool
+        if prev is not None and prev != tool and timestamp - self._last_time <= self.session_gap:
+            followers = self.counts.setdefault(prev, {})
+            followers[tool] = followers.get(tool, 0) + 1
+            self.totals[prev] = self.totals.get(prev, 0) + 1
+        self._last_tool = tool
+        self._last_time = timestamp
+
+    def load(self, log_path: str, lookback: float, internal: Iterable[str] = (), now: Optional[float] = None):
+        """Replay the usage log of the last `lookback` seconds into the model."""
+        now = time.time() if now is None else now
+        internal = set(internal)
+        for entry in iter_usage(log_path, since=now - lookback):
+            tool = entry.get("tool")
+            if is_downstream_call(tool, internal):
+                # Log entries are written on completion; start time is what orders calls
+                self.observe(tool, entry.get("timestamp", now) - (entry.get("duration") or 0))
+
+    def merge(self, other: "TransitionModel"):
+        """Add the counts of `other` (e.g. one loaded from history in a worker
+        thread) without touching this model's current sequence."""
+        for prev, followers in other.counts.items():
+            mine = self.counts.setdefault(prev, {})
+            for tool, n in followers.items():
+                mine[tool] = mine.get(tool, 0) + n
+        for prev, n in other.totals.items():
+            self.totals[prev] = self.totals.get(prev, 0) + n
+
+    def predict(self, tool: str, threshold: float, min_support: int = 3) -> List[str]:
+        """Tools that followed `tool` at least `threshold` of the time, most likely first."""
+        total = self.totals.get(tool, 0)
+        if total < min_support:
+            return []
+        followers = self.counts.get(tool, {})
+        likely = [(n / total, t) for t, n in followers.items() if n / total >= threshold]
+        return [t for _, t in sorted(likely, reverse=True)]
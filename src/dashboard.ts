@@ -2,7 +2,45 @@ import * as vscode from 'vscode';
 import * as fs from 'fs';
 import * as path from 'path';
 
+// How much of the end of usage.jsonl to read for the recent activity list
+const RECENT_LOG_BYTES = 256 * 1024;
+
 export class DashboardGenerator {
+    static readTail(logPath: string, maxBytes?: number): any[] {
+        const size = fs.statSync(logPath).size;
+        const start = maxBytes === undefined ? 0 : Math.max(0, size - maxBytes);
+        const buffer = Buffer.alloc(size - start);
+        const fd = fs.openSync(logPath, 'r');
+        try {
+            fs.readSync(fd, buffer, 0, buffer.length, start);
+        } finally {
+            fs.closeSync(fd);
+        }
+        const lines = buffer.toString('utf8').trim().split('\n');
+        if (start > 0) {
+            // Drop the partial first line
+            lines.shift();
+        }
+        return lines.map(line => {
+            try { return JSON.parse(line); } catch { return null; }
+        }).filter(x => x);
+    }
+
+    // Entries routed to a named server ({"server": ..., "tool"|"prefix": ...})
+    // may have no name of their own: show the name(s) they expose instead.
+    static inventoryEntry(t: any, servers: {[key: string]: any}): any {
+        if (!t.server) {
+            return { ...t, name: t.name || 'unnamed' };
+        }
+        const server = servers[t.server] || {};
+        const exposed = t.tool !== undefined ? t.tool : `${t.prefix || ''}*`;
+        return {
+            ...t,
+            name: t.name || (server.namespace ? `${t.server}.${exposed}` : exposed),
+            command: t.command || server.command
+        };
+    }
+
     static async getHtml(extensionUri: vscode.Uri, logPath: string, manifestPath: string): Promise<string> {
         // 1. Read Data
         let manifestTools: any[] = [];
@@ -11,35 +49,54 @@ export class DashboardGenerator {
         try {
             if (fs.existsSync(manifestPath)) {
                 const manifest = JSON.parse(fs.readFileSync(manifestPath, 'utf8'));
-                manifestTools = manifest.tools || [];
+                manifestTools = (manifest.tools || []).map((t: any) => DashboardGenerator.inventoryEntry(t, manifest.servers || {}));
             }
         } catch (e) {
             console.error("Error reading manifest:", e);
         }
 
+        // Totals come from the snapshot the router keeps next to the log;
+        // the log itself is only read for its most recent entries.
+        let snapshot: any = null;
+        const statsPath = path.join(path.dirname(logPath), 'usage_stats.json');
+        try {
+            if (fs.existsSync(statsPath)) {
+                snapshot = JSON.parse(fs.readFileSync(statsPath, 'utf8'));
+            }
+        } catch (e) {
+            console.error("Error reading usage stats:", e);
+        }
+
         try {
             if (fs.existsSync(logPath)) {
-                const content = fs.readFileSync(logPath, 'utf8');
-                logs = content.trim().split('\n').map(line => {
-                    try { return JSON.parse(line); } catch { return null; }
-                }).filter(x => x);
+                logs = DashboardGenerator.readTail(logPath, snapshot ? RECENT_LOG_BYTES : undefined);
             }
         } catch (e) {
             console.error("Error reading logs:", e);
         }
 
         // 2. Process Data
-        const totalCalls = logs.length;
-        const failedCalls = logs.filter(l => !l.success).length;
-        const successRate = totalCalls > 0 ? Math.round(((totalCalls - failedCalls) / totalCalls) * 100) : 100;
-        
-        // Group by Tool and discover tools from logs
+        let totalCalls: number;
+        let failedCalls: number;
         const toolUsage: {[key: string]: number} = {};
         const discoveredTools = new Set<string>();
-        logs.forEach(l => {
-            toolUsage[l.tool] = (toolUsage[l.tool] || 0) + 1;
-            discoveredTools.add(l.tool);
-        });
+        if (snapshot) {
+            totalCalls = snapshot.totals.calls;
+            failedCalls = snapshot.totals.errors;
+            Object.entries(snapshot.totals.tools as {[key: string]: any}).forEach(([tool, counts]) => {
+                toolUsage[tool] = counts.calls;
+                discoveredTools.add(tool);
+            });
+        } else {
+            // No router has written a snapshot yet: count the whole log
+            totalCalls = logs.length;
+            failedCalls = logs.filter(l => !l.success).length;
+            logs.forEach(l => {
+                toolUsage[l.tool] = (toolUsage[l.tool] || 0) + 1;
+                discoveredTools.add(l.tool);
+            });
+        }
+        const successRate = totalCalls > 0 ? Math.round(((totalCalls - failedCalls) / totalCalls) * 100) : 100;
 
         // Combine manifest tools and discovered tools
         const inventory: any[] = [...manifestTools];
@@ -70,8 +70,12 @@ export class ToolManager {
             console.warn("Could not read existing manifest, creating new one.");
         }
 
-        // Check duplicate
-        if (manifest.tools.find((t: any) => t.name === preset.name)) {
+        // Check duplicate: an entry by that name, or a server of that name
+        // with the entries routed to it (which need not have names of their own)
+        manifest.tools = manifest.tools || [];
+        const isExisting = (t: any) => t.name === preset.name || t.server === preset.name;
+        const hasServer = !!(manifest.servers && manifest.servers[preset.name]);
+        if (manifest.tools.some(isExisting) || hasServer) {
             const overwrite = await vscode.window.showWarningMessage(
                 `Tool '${preset.name}' already exists. Overwrite?`,
                 "Yes", "No"
@@ -79,7 +83,10 @@ export class ToolManager {
             if (overwrite !== "Yes") return;
             
             // Remove existing
-            manifest.tools = manifest.tools.filter((t: any) => t.name !== preset.name);
+            manifest.tools = manifest.tools.filter((t: any) => !isExisting(t));
+            if (hasServer) {
+                delete manifest.servers[preset.name];
+            }
         }
 
         // Construct Config